@@ -0,0 +1,158 @@
+"""Local HTTP stand-in for the parts of the Webex REST API the bots use.
+
+Point WebexAPI(base_url=FakeWebex.url) at it. Messages, people, memberships,
+attachment actions and webhooks are kept in memory, every call is counted per
+endpoint and `latency` adds a fixed delay to each response to mimic the real API.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+
+
+class FakeWebex:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.people = {}
+        self.messages = {}
+        self.actions = {}
+        self.memberships = {}  # roomId -> [membership]
+        self.webhooks = {}
+        self.calls = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.bot = self.add_person('bot@example.com', 'Bench Bot')
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = f'http://{host}:{self.server.server_address[1]}/v1/'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-webex', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _new_id(self, kind):
+        return f'{kind}-{next(self._ids)}'
+
+    def add_person(self, email, name=None):
+        person = {'id': self._new_id('person'), 'emails': [email], 'displayName': name or email.split('@')[0],
+                  'created': _now()}
+        with self._lock:
+            self.people[person['id']] = person
+        return person
+
+    def join(self, room_id, person):
+        membership = {'id': self._new_id('membership'), 'roomId': room_id, 'personId': person['id'],
+                      'personEmail': person['emails'][0], 'created': _now()}
+        with self._lock:
+            self.memberships.setdefault(room_id, []).append(membership)
+        return membership
+
+    def post_message(self, person, room_id, text):
+        # A message typed by a user, returned as the webhook event Webex would send
+        message = {'id': self._new_id('message'), 'roomId': room_id, 'personId': person['id'],
+                   'personEmail': person['emails'][0], 'text': text, 'created': _now()}
+        with self._lock:
+            self.messages[message['id']] = message
+        return self.event('messages', message)
+
+    def submit_card(self, person, room_id, inputs):
+        action = {'id': self._new_id('action'), 'type': 'submit', 'roomId': room_id, 'personId': person['id'],
+                  'inputs': inputs, 'created': _now()}
+        with self._lock:
+            self.actions[action['id']] = action
+        return self.event('attachmentActions', action)
+
+    def event(self, resource, data):
+        return {'id': self._new_id('webhook'), 'name': f'{resource}_webhook', 'resource': resource,
+                'event': 'created', 'actorId': data['personId'], 'created': _now(),
+                'data': {key: data[key] for key in ('id', 'roomId', 'personId', 'personEmail', 'created') if key in data}}
+
+    def count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def handle(self, method, path, query, body):
+        """Returns (status, json body) for one API call."""
+        parts = path.strip('/').split('/')[1:]  # drop the 'v1' prefix
+        resource = parts[0] if parts else ''
+        if resource == 'attachment':
+            resource, parts = 'attachment/actions', parts[1:]
+        item = parts[1] if len(parts) > 1 else None
+        self.count(f'{method} {resource}' + ('/{id}' if item else ''))
+
+        with self._lock:
+            if resource == 'people':
+                person = self.bot if item == 'me' else self.people.get(item)
+                return (200, person) if person else (404, None)
+            if resource == 'messages':
+                if method == 'POST':
+                    message = dict(body, id=self._new_id('message'), personId=self.bot['id'],
+                                   personEmail=self.bot['emails'][0], created=_now())
+                    self.messages[message['id']] = message
+                    return 200, message
+                if method == 'PUT' and item in self.messages:
+                    self.messages[item].update(body)
+                    return 200, self.messages[item]
+                if method == 'GET' and item in self.messages:
+                    return 200, self.messages[item]
+                return 404, None
+            if resource == 'attachment/actions':
+                action = self.actions.get(item)
+                return (200, action) if action else (404, None)
+            if resource == 'memberships':
+                return 200, {'items': list(self.memberships.get(query.get('roomId', [''])[0], []))}
+            if resource == 'webhooks':
+                if method == 'GET':
+                    return 200, {'items': list(self.webhooks.values())}
+                if method == 'POST':
+                    hook = dict(body, id=self._new_id('webhook'), status='active', created=_now())
+                    self.webhooks[hook['id']] = hook
+                    return 200, hook
+                if item not in self.webhooks:
+                    return 404, None
+                if method == 'PUT':
+                    self.webhooks[item].update(body)
+                    return 200, self.webhooks[item]
+                del self.webhooks[item]
+                return 204, None
+        return 404, None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        url = urlparse(self.path)
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        status, payload = fake.handle(self.command, url.path, parse_qs(url.query), body)
+        data = json.dumps(payload if payload is not None else {'message': 'Not found'}).encode() if status != 204 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, format, *args):
+        pass
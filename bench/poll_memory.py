@@ -0,0 +1,100 @@
+"""Compare the memory used by poll state before and after the compact representation.
+
+    python -m bench.poll_memory --polls 2000 --voters 100000 --options 4
+
+The "dict" layout is the one LocalPollState used to keep per room: options and
+votes as dicts keyed by option number and a set of voter emails. The "compact"
+layout is today's LocalPollState. Both are filled with the same votes and
+measured with tracemalloc.
+"""
+import argparse
+import gc
+import threading
+import tracemalloc
+
+from common.poll import PollRegistry
+from common.state import LocalPollState
+
+
+class DictRoom:
+    def __init__(self, meta):
+        self.lock = threading.Lock()
+        self.meta = dict(meta)
+        self.options = {}
+        self.next_option = 1
+        self.votes = {}
+        self.voters = set()
+
+    def add_option(self, text):
+        num = self.next_option
+        self.next_option = num + 1
+        self.options[num] = text
+        self.votes[num] = 0
+
+    def vote(self, option_num, voter):
+        with self.lock:
+            if voter in self.voters:
+                return False
+            self.votes[option_num] = self.votes.get(option_num, 0) + 1
+            self.voters.add(voter)
+            return True
+
+
+def fill_dict(polls, voters, options):
+    rooms = {}
+    for p in range(polls):
+        room = rooms[f'room-{p}'] = DictRoom({'name': f'Poll {p}', 'description': 'memory', 'author': 'a@example.com',
+                                             'started': True})
+        for o in range(options):
+            room.add_option(f'Option {o}')
+    for i in range(voters):
+        rooms[f'room-{i % polls}'].vote(1 + i % options, f'employee.number{i}@example.com')
+    return rooms
+
+
+def fill_compact(polls, voters, options):
+    registry = PollRegistry(LocalPollState())
+    for p in range(polls):
+        poll = registry.new_poll(f'Poll {p}', 'memory', f'room-{p}', 'a@example.com')
+        poll.started = True
+        for o in range(options):
+            poll.add_option(f'Option {o}')
+    state = registry.state
+    for i in range(voters):
+        state.vote(f'room-{i % polls}', 1 + i % options, f'employee.number{i}@example.com')
+    return registry
+
+
+def measure(fill, *args):
+    gc.collect()
+    tracemalloc.start()
+    kept = fill(*args)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--polls', type=int, default=2000)
+    parser.add_argument('--voters', type=int, default=100000)
+    parser.add_argument('--options', type=int, default=4)
+    args = parser.parse_args()
+
+    dict_bytes, _ = measure(fill_dict, args.polls, args.voters, args.options)
+    compact_bytes, registry = measure(fill_compact, args.polls, args.voters, args.options)
+    for label, used in (('dict', dict_bytes), ('compact', compact_bytes)):
+        print(f'{label:>8}: {used / 2 ** 20:8.1f} MiB  ({used / args.voters:6.1f} bytes per vote)')
+    print(f'compact uses {compact_bytes / dict_bytes:.0%} of the dict layout')
+
+    tracemalloc.start()
+    summaries = [registry.end_poll(room_id) for room_id in list(registry)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{len(summaries)} ended polls frozen into summaries: {used / 2 ** 20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
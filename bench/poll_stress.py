@@ -0,0 +1,70 @@
+"""Fire concurrent votes at Poll and check that every tally is exact.
+
+    python -m bench.poll_stress --votes 100000 --threads 32 --rooms 8
+    python -m bench.poll_stress --state-url redis://127.0.0.1:6379/0
+"""
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.poll import PollRegistry
+from common.state import LocalPollState, RespPollState
+
+
+def run(state, votes, threads, rooms, options):
+    registry = PollRegistry(state)
+    polls = []
+    for r in range(rooms):
+        poll = registry.new_poll(f'Stress {r}', 'stress test', f'room-{r}', 'author@example.com')
+        for o in range(options):
+            poll.add_option(f'option {o}')
+        polls.append(poll)
+
+    accepted = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(t):
+        barrier.wait()
+        for i in range(t, votes, threads):
+            poll = polls[i % rooms]
+            # Every voter votes twice: the second attempt must always be rejected
+            if poll.vote(1 + i % options, f'user-{i}@example.com'):
+                accepted[t] += 1
+            if poll.vote(1 + (i + 1) % options, f'user-{i}@example.com'):
+                accepted[t] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+
+    failures = []
+    if sum(accepted) != votes:
+        failures.append(f'accepted {sum(accepted)} votes, expected {votes}')
+    for r, poll in enumerate(polls):
+        expected = {o: 0 for o in range(1, options + 1)}
+        for i in range(r, votes, rooms):
+            expected[1 + i % options] += 1
+        if poll.votes != expected:
+            failures.append(f'room-{r}: tallies {poll.votes}, expected {expected}')
+        if poll.voter_count != sum(expected.values()):
+            failures.append(f'room-{r}: {poll.voter_count} voters, expected {sum(expected.values())}')
+
+    print(f'{votes} votes over {threads} threads in {elapsed:.2f}s ({votes / elapsed:,.0f} votes/s)')
+    for failure in failures:
+        print('FAIL', failure)
+    return not failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--votes', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rooms', type=int, default=8)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--state-url')
+    args = parser.parse_args()
+    state = RespPollState.from_url(args.state_url) if args.state_url else LocalPollState()
+    sys.exit(0 if run(state, args.votes, args.threads, args.rooms, args.options) else 1)
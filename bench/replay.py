@@ -0,0 +1,123 @@
+"""Replay a webhook event log through a bot against the local fake Webex API.
+
+    python -m bench.replay events.jsonl --task task3
+    python -m bench.replay events.jsonl --task task3 --speed 1 --workers 8
+    python -m bench.replay events.jsonl --task task3 --poll-db recovered.db
+    python -m bench.replay host-events.jsonl --task task3 --bot poll
+
+Record the log by running a bot with EVENT_LOG_PATH set. Events go straight to
+process_message / process_card_response, one after another in log order unless
+--workers is given. The messages, card inputs and people the bot fetched while
+recording are served back by the fake API, and its replies stay local.
+--poll-db rebuilds task2 or task3's poll database from the log. A log shared by the
+bots of common.host is replayed one bot at a time, picked with --bot.
+"""
+import argparse
+import contextlib
+import io
+import time
+import traceback
+
+from webexpythonsdk import Webhook
+
+from bench.fake_webex import FakeWebex
+from bench.webhook_bench import TASKS, load_bot, wait_for_outbound
+from common.dedupe import event_key
+from common.eventlog import read_events
+
+HANDLERS = {'messages': 'process_message', 'attachmentActions': 'process_card_response'}
+
+
+def load_recorded(fake, path, bot_name=None):
+    webhooks = 0
+    for _, kind, data in read_events(path, bot_name):
+        if kind == 'webhook':
+            webhooks += 1
+            if 'personEmail' in data['data']:
+                # The bot may have had this person's email cached instead of fetching it
+                person = {'id': data['data']['personId'], 'emails': [data['data']['personEmail']]}
+                fake.people.setdefault(person['id'], person)
+        elif kind == 'messages.get':
+            fake.messages[data['id']] = data
+        elif kind == 'attachment_actions.get':
+            fake.actions[data['id']] = data
+        elif kind == 'people.get':
+            fake.people[data['id']] = data
+        elif kind == 'people.me':
+            fake.bot = fake.people[data['id']] = data
+    return webhooks
+
+
+def replay(bot, path, speed=0.0, use_workers=False, bot_name=None):
+    counts = {'replayed': 0, 'duplicates': 0, 'skipped': 0, 'failed': 0}
+    first_t = started = None
+    for t, kind, payload in read_events(path, bot_name):
+        if kind != 'webhook':
+            continue
+        handler = getattr(bot, HANDLERS.get(payload.get('resource'), ''), None)
+        if handler is None:
+            counts['skipped'] += 1
+            continue
+        if not bot.seen_events.first_time(event_key(payload)):
+            counts['duplicates'] += 1
+            continue
+        if speed:
+            if first_t is None:
+                first_t, started = t, time.perf_counter()
+            delay = (t - first_t) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        data = Webhook(payload).data
+        counts['replayed'] += 1
+        if use_workers:
+            while not bot.workers.submit(handler, data):
+                time.sleep(0.01)
+            continue
+        try:
+            handler(data)
+        except Exception:
+            counts['failed'] += 1
+            traceback.print_exc()
+    if use_workers:
+        bot.workers.join()
+        counts['failed'] = bot.workers.stats()['failed']
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log')
+    parser.add_argument('--task', choices=TASKS, required=True)
+    parser.add_argument('--bot', help='replay only this bot from a log shared by common.host, e.g. poll')
+    parser.add_argument('--speed', type=float, default=0.0, help='1 replays at recorded speed, 0 as fast as possible')
+    parser.add_argument('--workers', type=int, default=0, help='hand events to a WorkerPool instead of running them in order')
+    parser.add_argument('--poll-db', help='task2 and task3: write the replayed polls to this database')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds added to every fake API call')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help="keep the bots' own output")
+    args = parser.parse_args()
+
+    fake = FakeWebex(latency=args.api_latency)
+    webhooks = load_recorded(fake, args.log, args.bot)
+    fake.start()
+    bot = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext():
+            bot = load_bot(args.task, fake, workers=max(args.workers, 1), queue_size=max(webhooks, 1),
+                           poll_db=args.poll_db)
+            started = time.perf_counter()
+            counts = replay(bot, args.log, args.speed, args.workers > 0, args.bot)
+            elapsed = time.perf_counter() - started
+            wait_for_outbound(bot, fake)
+    finally:
+        if args.poll_db and bot is not None:
+            # Flushes the votes still buffered by the store
+            bot.all_polls.state.store.close()
+        fake.stop()
+
+    print(f"Replayed {counts['replayed']} of {webhooks} webhooks in {elapsed:.2f}s "
+          f"({counts['replayed'] / elapsed if elapsed else 0:,.0f} events/s): {counts['duplicates']} duplicates, "
+          f"{counts['skipped']} skipped, {counts['failed']} failed, {fake.total_calls()} fake API calls")
+
+
+if __name__ == '__main__':
+    main()
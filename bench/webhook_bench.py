@@ -0,0 +1,278 @@
+"""Drive the bots with synthetic webhooks against a local fake Webex API.
+
+    python -m bench.webhook_bench --events 5000 --concurrency 16
+    python -m bench.webhook_bench --task task3 --api-latency 0.05
+
+Each bot is wired up by its own setup(), as its __main__ block does it, but
+against bench.fake_webex instead of webexapis.com, with in-memory databases and
+no ngrok. Webhooks are posted
+through Flask's test client and every event is timed from the POST until its
+handler returns. task1's echo bot runs first and is the baseline for the others.
+
+    python -m bench.webhook_bench --task task3 --api-latency 0.05 --async-server
+
+runs task3 with ASYNC_SERVER=1 instead, posting to the aiohttp app over HTTP.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.fake_webex import FakeWebex
+from common.workers import WorkerPool
+
+TOKEN = 'bench-token'
+TASKS = ('task1', 'task2', 'task3', 'task4')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[round(p / 100 * (len(values) - 1))] if values else 0.0
+
+
+def load_bot(name, fake, workers=4, queue_size=1000, rate=1000.0, metrics=False, poll_db=None):
+    """Imports a bot module and runs its setup() against the fake API.
+
+    The settings are read when the bot is first imported, so every bot loaded in
+    one process shares them. poll_db keeps task2 and task3's polls in that file.
+    """
+    os.environ['METRICS'] = '1' if metrics else '0'
+    os.environ['WEBEX_RATE'] = str(rate)
+    os.environ['WEBEX_BURST'] = str(max(1, round(rate)))
+    os.environ['ANONYMOUS_POLL_DB_PATH'] = os.environ['POLL_DB_PATH'] = poll_db or ':memory:'
+    os.environ['POLL_ARCHIVE_PATH'] = os.environ['NOTES_DB_PATH'] = ':memory:'
+    bot = importlib.import_module(name)
+    bot.setup(TOKEN, shared_workers=WorkerPool(workers, queue_size), base_url=fake.url)
+    return bot
+
+
+def poll_events(fake, users, rooms, args, extra_command):
+    # Every room gets a started poll before the clock starts
+    author = users[0]
+    setup = []
+    for room in rooms:
+        setup.append([('card: create poll', fake.submit_card(author, room, {
+            'roomId': room, 'poll_name': f'Poll {room}', 'poll_description': 'benchmark'}))])
+        setup.append([('card: add option', fake.submit_card(author, room, {'roomId': room, 'option_text': f'Option {o}'}))
+                      for o in range(1, args.options + 1)])
+    setup.append([('message: start poll', fake.post_message(author, room, 'start poll')) for room in rooms])
+
+    timed = []
+    for i in range(args.events):
+        room = rooms[i % len(rooms)]
+        voter = users[(i // len(rooms)) % len(users)]
+        if i % 10 == 9:
+            timed.append((f'message: {extra_command}', fake.post_message(voter, room, extra_command)))
+        else:
+            timed.append(('card: vote', fake.submit_card(voter, room, {
+                'roomId': room, 'poll_choice': str(1 + i % args.options)})))
+    return setup, timed
+
+
+def build_events(name, fake, args):
+    """Returns (setup, timed): setup is a list of steps run one after another, untimed."""
+    users = [fake.add_person(f'user{i}@example.com') for i in range(args.users)]
+    rooms = [f'room-{r}' for r in range(args.rooms)]
+    for room in rooms:
+        for user in users:
+            fake.join(room, user)
+
+    if name == 'task1':
+        return [], [('message: hello', fake.post_message(users[i % len(users)], rooms[i % len(rooms)], 'hello'))
+                    for i in range(args.events)]
+    if name == 'task2':
+        return poll_events(fake, users, rooms, args, 'help')
+    if name == 'task3':
+        return poll_events(fake, users, rooms, args, 'show poll')
+
+    timed = []
+    for i in range(args.events):
+        user = users[i % len(users)]
+        if i % 50 == 49:
+            timed.append(('message: /clear', fake.post_message(user, 'direct', '/clear')))
+        elif i % 10 == 9:
+            timed.append(('message: /show', fake.post_message(user, 'direct', '/show')))
+        else:
+            timed.append(('message: /add', fake.post_message(user, 'direct', f'/add note {i}')))
+    return [], timed
+
+
+class Recorder:
+    def __init__(self):
+        self.started = {}  # event data id -> (label, posted_at)
+        self.latencies = {}
+        self.finished = 0
+        self._cond = threading.Condition()
+
+    def wrap(self, handler):
+        def timed(data):
+            try:
+                return handler(data)
+            finally:
+                self.done(data.id)
+        return timed
+
+    def wrap_async(self, handler):
+        async def timed(data):
+            try:
+                return await handler(data)
+            finally:
+                self.done(data.id)
+        timed.__name__ = handler.__name__
+        return timed
+
+    def posted(self, label, event):
+        with self._cond:
+            self.started[event['data']['id']] = (label, time.perf_counter())
+
+    def done(self, event_id):
+        now = time.perf_counter()
+        with self._cond:
+            label, posted_at = self.started.pop(event_id)
+            self.latencies.setdefault(label, []).append(now - posted_at)
+            self.finished += 1
+            self._cond.notify_all()
+
+    def wait(self, count):
+        with self._cond:
+            self._cond.wait_for(lambda: self.finished >= count)
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def post(self, path, json):
+        return self.session.post(self.base_url + path, json=json)
+
+
+def start_async_server(bot, fake, recorder, args):
+    """Serves task3's aiohttp app from a background event loop and returns its URL."""
+    from aiohttp import web
+    from common.aio import AsyncWebex, AsyncWebhookServer
+
+    bot.async_webex = AsyncWebex(TOKEN, base_url=fake.url, metrics=bot.metrics)
+    server = AsyncWebhookServer({
+        '/messages_webhook': recorder.wrap_async(bot.process_message_async),
+        '/attachmentActions_webhook': recorder.wrap_async(bot.process_card_response_async),
+    }, bot.seen_events, bot.async_webex, args.events * 2, args.workers, metrics=bot.metrics)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(server.app())
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    threading.Thread(target=loop.run_forever, name='async-server', daemon=True).start()
+    return f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+
+def post_all(make_client, recorder, events, concurrency):
+    local = threading.local()
+    acks = []
+
+    def post(item):
+        label, event = item
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = make_client()
+        recorder.posted(label, event)
+        started = time.perf_counter()
+        response = client.post(f"/{event['resource']}_webhook", json=event)
+        acks.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"{label} got HTTP {response.status_code}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(post, events))
+    return acks
+
+
+def wait_for_outbound(bot, fake):
+    # The dispatcher queue is empty once the last reply has been handed to a sender
+    previous = -1
+    while bot.dispatcher.pending() or fake.total_calls() != previous:
+        previous = fake.total_calls()
+        time.sleep(0.05)
+
+
+def run(name, args):
+    fake = FakeWebex(latency=args.api_latency).start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext():
+            bot = load_bot(name, fake, args.workers, args.events * 2, args.rate, args.metrics)
+            recorder = Recorder()
+            bot.process_message = recorder.wrap(bot.process_message)
+            if hasattr(bot, 'process_card_response'):
+                bot.process_card_response = recorder.wrap(bot.process_card_response)
+            make_client = bot.app.test_client
+            if args.async_server:
+                url = start_async_server(bot, fake, recorder, args)
+                make_client = lambda: HttpClient(url)
+
+            setup, timed = build_events(name, fake, args)
+            for step in setup:
+                expected = recorder.finished + len(step)
+                post_all(make_client, recorder, step, args.concurrency)
+                recorder.wait(expected)
+            wait_for_outbound(bot, fake)
+            recorder.latencies.clear()
+            recorder.finished = 0
+            calls_before = fake.total_calls()
+
+            started = time.perf_counter()
+            acks = post_all(make_client, recorder, timed, args.concurrency)
+            recorder.wait(len(timed))
+            handled = time.perf_counter() - started
+            wait_for_outbound(bot, fake)
+            drained = time.perf_counter() - started
+    finally:
+        fake.stop()
+
+    throughput = len(timed) / handled
+    print(f'{name}: {len(timed)} events handled in {handled:.2f}s ({throughput:,.0f} events/s), '
+          f'{fake.total_calls() - calls_before} API calls done after {drained:.2f}s')
+    print(f"  {'handler':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = sorted(recorder.latencies.items()) + [('webhook ack', acks)]
+    for label, values in rows:
+        print(f'  {label:<22}{len(values):>8}' + ''.join(
+            f'{1000 * percentile(values, p):>10.2f}' for p in (50, 95, 99, 100)))
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--task', choices=TASKS + ('all',), default='all')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16, help='threads posting webhooks')
+    parser.add_argument('--workers', type=int, default=4, help='WEBHOOK_WORKERS for the bot')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rooms', type=int, default=8)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1000.0, help='dispatcher calls/s per endpoint')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds added to every fake API call')
+    parser.add_argument('--metrics', action='store_true', help='run with METRICS=1 to measure its overhead')
+    parser.add_argument('--async-server', action='store_true', help='task3 only: serve webhooks from asyncio')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help="keep the bots' own output")
+    args = parser.parse_args()
+    if args.async_server and args.task != 'task3':
+        parser.error('--async-server needs --task task3')
+
+    baseline = None
+    for name in TASKS if args.task == 'all' else (args.task,):
+        throughput = run(name, args)
+        if name == 'task1':
+            baseline = throughput
+        elif baseline:
+            print(f'  {throughput / baseline:.2f}x the task1 baseline')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""asyncio webhook server and Webex client, for hosting thousands of in-flight events.
+
+Needs aiohttp. Handlers are coroutines that take the webhook's data; they await
+their Webex fetches here, concurrently where they can, and hand the rest of the
+work to the bots' existing synchronous code.
+"""
+import asyncio
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from webexpythonsdk import Webhook
+
+from common.dedupe import event_key
+
+WEBEX_BASE_URL = 'https://webexapis.com/v1/'
+
+
+class AsyncApiError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f'[{status_code}] {message}')
+        self.status_code = status_code
+
+
+class AsyncWebex:
+    """The few Webex REST calls the webhook handlers need, over one aiohttp session."""
+
+    def __init__(self, access_token, base_url=WEBEX_BASE_URL, limit=100, timeout=60, max_retries=5, backoff=0.5,
+                 metrics=None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.access_token = access_token
+        self.limit = limit
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self._session = None
+        self._email_lookups = {}  # personId -> Future shared by concurrent callers
+
+    async def start(self, app=None):
+        self._session = aiohttp.ClientSession(
+            headers={'Authorization': f'Bearer {self.access_token}', 'Content-Type': 'application/json'},
+            connector=aiohttp.TCPConnector(limit=self.limit),
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self, app=None):
+        await self._session.close()
+
+    async def request(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self._request(method, path, **kwargs)
+        except Exception as e:
+            if self.metrics is not None and self.metrics.enabled:
+                self.metrics.inc('webex_api_errors_total', endpoint=endpoint, status=getattr(e, 'status_code', None) or 'exception')
+            raise
+        finally:
+            if self.metrics is not None and self.metrics.enabled:
+                self.metrics.observe('webex_api_call_seconds', time.perf_counter() - started, endpoint=endpoint)
+
+    async def _request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                async with self._session.request(method, self.base_url + path, **kwargs) as response:
+                    if response.status == 429:
+                        delay = float(response.headers.get('Retry-After', 1)) + random.uniform(0, 1)
+                    elif response.status >= 500:
+                        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                    elif response.status >= 400:
+                        raise AsyncApiError(response.status, await response.text())
+                    else:
+                        return await response.json() if response.status != 204 else None
+                    error = AsyncApiError(response.status, response.reason)
+            except aiohttp.ClientError as e:
+                error = e
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            await asyncio.sleep(delay)
+
+    async def get_message(self, message_id):
+        return await self.request('messages.get', 'GET', f'messages/{message_id}')
+
+    async def get_attachment_action(self, action_id):
+        return await self.request('attachment_actions.get', 'GET', f'attachment/actions/{action_id}')
+
+    async def get_person(self, person_id):
+        return await self.request('people.get', 'GET', f'people/{person_id}')
+
+    async def get_email(self, identity, person_id):
+        # Same cache as the threaded handlers, filled without blocking the loop
+        email = identity.cached_email(person_id)
+        if email is not None:
+            return email
+        lookup = self._email_lookups.get(person_id)
+        if lookup is None:
+            lookup = self._email_lookups[person_id] = asyncio.ensure_future(self._fetch_email(identity, person_id))
+            lookup.add_done_callback(lambda _: self._email_lookups.pop(person_id, None))
+        return await asyncio.shield(lookup)
+
+    async def _fetch_email(self, identity, person_id):
+        email = (await self.get_person(person_id))['emails'][0]
+        identity.remember(person_id, email)
+        return email
+
+
+class AsyncWebhookServer:
+    """aiohttp app that acks each webhook at once and runs its handler as a task.
+
+    handlers maps a route, e.g. '/messages_webhook', to a coroutine taking the
+    webhook data. Past max_in_flight unfinished events it answers 503 so Webex
+    redelivers later, like WorkerPool does when its queue is full. asyncio.to_thread()
+    calls from the handlers share a pool of sync_workers threads. With
+    ordered_rooms, an event's handler starts only once the previous event from
+    the same room has finished, as with WorkerPool keys.
+    """
+
+    def __init__(self, handlers, seen_events, webex=None, max_in_flight=10000, sync_workers=4, event_log=None,
+                 metrics=None, ordered_rooms=True):
+        self.handlers = handlers
+        self.seen_events = seen_events
+        self.webex = webex
+        self.max_in_flight = max_in_flight
+        self.sync_workers = sync_workers
+        self.event_log = event_log
+        self.metrics = metrics
+        self.ordered_rooms = ordered_rooms
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_in_flight_seen = 0
+        self._tasks = set()
+        self._room_tails = {}  # roomId -> task of the room's latest event
+
+    def app(self):
+        app = web.Application()
+        for route, handler in self.handlers.items():
+            app.router.add_post(route, self._route(route, handler))
+        app.router.add_get('/stats', self._stats)
+        if self.metrics is not None and self.metrics.enabled:
+            app.router.add_get('/metrics', self._metrics)
+        app.on_startup.append(self._startup)
+        if self.webex is not None:
+            app.on_startup.append(self.webex.start)
+            app.on_cleanup.append(self.webex.close)
+        return app
+
+    async def _startup(self, app):
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.sync_workers, 'async-sync'))
+
+    def stats(self):
+        return {'in_flight': len(self._tasks), 'max_in_flight': self.max_in_flight_seen, 'processed': self.processed,
+                'failed': self.failed, 'rejected': self.rejected}
+
+    def _route(self, route, handler):
+        async def receive(request):
+            try:
+                payload = await request.json()
+            except ValueError:
+                payload = None
+            if not payload or 'data' not in payload:
+                return web.Response(status=400, text='Bad Request')
+            if self.event_log is not None:
+                self.event_log.append('webhook', payload)
+            key = event_key(payload)
+            if not self.seen_events.first_time(key):
+                # Webex redelivered an event we already accepted
+                return web.Response(text='200')
+            if len(self._tasks) >= self.max_in_flight:
+                self.seen_events.forget(key)
+                self.rejected += 1
+                return web.Response(status=503, text='Busy')
+            data = Webhook(payload).data
+            room_id = getattr(data, 'roomId', None) if self.ordered_rooms else None
+            task = asyncio.create_task(self._run(handler, data, self._room_tails.get(room_id)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if room_id is not None:
+                self._room_tails[room_id] = task
+                task.add_done_callback(lambda done: self._room_tails.get(room_id) is done and self._room_tails.pop(room_id))
+            self.max_in_flight_seen = max(self.max_in_flight_seen, len(self._tasks))
+            return web.Response(text='200')
+        return receive
+
+    async def _run(self, handler, data, previous=None):
+        if previous is not None:
+            await asyncio.wait([previous])
+        started = time.perf_counter()
+        try:
+            await handler(data)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            traceback.print_exc()
+        if self.metrics is not None and self.metrics.enabled:
+            self.metrics.observe('bot_handler_seconds', time.perf_counter() - started, handler=handler.__name__)
+
+    async def _stats(self, request):
+        return web.json_response(self.stats())
+
+    async def _metrics(self, request):
+        return web.Response(text=self.metrics.render(), content_type='text/plain')
+
+    def run(self, host='0.0.0.0', port=12000):
+        web.run_app(self.app(), host=host, port=port)
@@ -0,0 +1,116 @@
+"""Bootstrap shared by every bot module: its Flask app, webhook routes and Webex clients.
+
+A bot module creates its app with create_app(bot), registers each webhook
+handler with @webhook_route(bot, path) and calls setup_common(bot, ...) from
+its setup(), where bot is the module itself. setup_common() sets teams_api,
+identity, dispatcher, workers, seen_events and event_log on the module, so
+the bot's handlers use them as plain globals.
+"""
+import os
+
+from dotenv import load_dotenv
+from flask import Flask, request
+from webexpythonsdk import Webhook
+
+from common.dedupe import SeenEvents, event_key
+from common.dispatcher import Dispatcher, pooled_api
+from common.eventlog import EventLog
+from common.identity import IdentityCache
+from common.metrics import render_all
+from common.utils import reconcile_webhooks
+from common.workers import WorkerPool
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Get the bot access token from the environment variable
+WEBEX_TEAMS_ACCESS_TOKEN = os.getenv('WEBEX_TEAMS_ACCESS_TOKEN')
+
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+DEDUPE_WINDOW = int(os.getenv('DEDUPE_WINDOW', '3600'))
+# Public base URL for webhooks, looked up from ngrok when not set
+PUBLIC_URL = os.getenv('PUBLIC_URL')
+# Expose latency histograms on /metrics
+METRICS = os.getenv('METRICS', '0') == '1'
+# Append every inbound webhook to this JSONL file, see bench/replay.py
+EVENT_LOG_PATH = os.getenv('EVENT_LOG_PATH')
+# Threads sending outbound Webex calls, and an optional local limit in calls/s per endpoint.
+# Without WEBEX_RATE the dispatcher goes as fast as Webex allows and backs off on its 429s
+WEBEX_SENDERS = int(os.getenv('WEBEX_SENDERS', '16'))
+WEBEX_RATE = float(os.getenv('WEBEX_RATE', '0')) or None
+WEBEX_BURST = int(os.getenv('WEBEX_BURST', '20'))
+
+
+def create_app(bot):
+    app = Flask(bot.__name__)
+    app.add_url_rule('/stats', 'stats', lambda: bot.workers.stats())
+    app.add_url_rule('/metrics', 'metrics', lambda: metrics_response({None: bot.metrics}))
+    return app
+
+
+def metrics_response(metrics_by_bot):
+    enabled = {name: metrics for name, metrics in metrics_by_bot.items() if metrics.enabled}
+    if not enabled:
+        return 'Metrics are disabled, set METRICS=1', 404
+    return render_all(enabled), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+def webhook_route(bot, path, key_fn=None):
+    """Registers a POST route that acks the webhook at once and runs handler(data) on the worker pool.
+
+    Events with the same key_fn(data), e.g. a roomId, are handled in order.
+    """
+    def register(handler):
+        name = handler.__name__
+
+        @bot.metrics.timed('bot_route_seconds', route=path)
+        def receive():
+            payload = request.get_json(silent=True)
+            if not payload or 'data' not in payload:
+                return 'Bad Request', 400
+            if bot.event_log is not None:
+                bot.event_log.append('webhook', payload)
+            key = event_key(payload)
+            if not bot.seen_events.first_time(key):
+                # Webex redelivered an event we already accepted
+                return '200'
+            data = Webhook(payload).data
+            # Looked up on each event, like a global, so bench/ can wrap the handler after import
+            if not bot.workers.submit(getattr(bot, name), data, key=key_fn(data) if key_fn else None):
+                # Queue is full, let Webex redeliver the event later
+                bot.seen_events.forget(key)
+                return 'Busy', 503
+            return '200'
+
+        bot.app.add_url_rule(path, path, receive, methods=['POST'])
+        return handler
+    return register
+
+
+def setup_common(bot, access_token=None, shared_workers=None, adapter=None, dedupe_client=None, event_log=None,
+                 base_url=None):
+    # common/host.py passes each bot its own token along with the shared worker and connection pools,
+    # and its view of the shared event log. bench/ points base_url at its fake Webex API
+    access_token = access_token or WEBEX_TEAMS_ACCESS_TOKEN
+    if not access_token:
+        raise ValueError("WEBEX_TEAMS_ACCESS_TOKEN is not set correctly in the environment variables")
+    bot.teams_api = bot.metrics.instrument_api(pooled_api(access_token, base_url=base_url, adapter=adapter))
+    if event_log is None and EVENT_LOG_PATH:
+        event_log = EventLog(EVENT_LOG_PATH)
+    if event_log is not None:
+        bot.event_log = event_log
+        bot.event_log.record_api(bot.teams_api)
+    bot.identity = IdentityCache(bot.teams_api)
+    bot.router.mention_names = bot.identity.mention_names()
+    bot.dispatcher = Dispatcher(pooled_api(access_token, base_url=base_url, adapter=adapter), WEBEX_SENDERS, WEBEX_RATE,
+                                WEBEX_BURST, metrics=bot.metrics)
+    bot.workers = shared_workers or WorkerPool(WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    bot.seen_events = SeenEvents(ttl=DEDUPE_WINDOW, client=dedupe_client)
+
+
+def run(bot, port=12000):
+    # Standalone bot: its own token from the environment, its webhooks and its Flask server
+    bot.setup()
+    reconcile_webhooks(bot.teams_api, bot.WEBHOOKS, PUBLIC_URL)
+    bot.app.run(host='0.0.0.0', port=port)
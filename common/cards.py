@@ -0,0 +1,136 @@
+import json
+import threading
+from collections import OrderedDict
+
+CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+
+
+class EncodedCard(dict):
+    """A card attachment that also carries its JSON encoding, so it is only serialised once."""
+
+    def __init__(self, attachment):
+        super().__init__(attachment)
+        self.encoded = json.dumps(attachment, separators=(',', ':'))
+
+
+class CardTemplate:
+    """A card skeleton built once; fill() copies only the containers on the way to each slot."""
+
+    def __init__(self, skeleton, **slots):
+        self.skeleton = skeleton
+        self.slots = slots
+
+    def fill(self, **values):
+        card = dict(self.skeleton)
+        copied = {(): card}
+        for name, value in values.items():
+            path = self.slots[name]
+            node = card
+            for depth, key in enumerate(path[:-1]):
+                prefix = path[:depth + 1]
+                child = copied.get(prefix)
+                if child is None:
+                    child = node[key]
+                    child = copied[prefix] = list(child) if isinstance(child, list) else dict(child)
+                    node[key] = child
+                node = child
+            node[path[-1]] = value
+        return card
+
+
+def _card(body, actions):
+    return {
+        "contentType": CARD_CONTENT_TYPE,
+        "content": {
+            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+            "type": "AdaptiveCard",
+            "version": "1.1",
+            "body": body,
+            "actions": actions
+        }
+    }
+
+
+def _room_input():
+    return {"type": "Input.Text", "id": "roomId", "value": None, "isVisible": False}
+
+
+_SUBMIT = [{"type": "Action.Submit", "title": "OK"}]
+
+START_POLL = CardTemplate(_card([
+    {"type": "TextBlock", "text": "Please type your poll name below"},
+    {"type": "Input.Text", "id": "poll_name", "placeholder": "Poll Name", "maxLength": 100},
+    {"type": "TextBlock", "text": "Please type your poll description below"},
+    {"type": "Input.Text", "id": "poll_description", "placeholder": "Poll Description", "maxLength": 500,
+     "isMultiline": True},
+    {"type": "Input.Number", "id": "poll_duration", "placeholder": "Close automatically after (minutes, optional)",
+     "min": 1},
+    {"type": "Input.Text", "id": "poll_reminders", "placeholder": "Remind non-voters N minutes before it closes, e.g. 60,10",
+     "maxLength": 100},
+    _room_input()
+], _SUBMIT), roomId=('content', 'body', 6, 'value'))
+
+ADD_OPTION = CardTemplate(_card([
+    {"type": "TextBlock", "text": "Please type the option you would like to add below:"},
+    {"type": "Input.Text", "id": "option_text", "placeholder": "Option Text", "maxLength": 100},
+    _room_input()
+], _SUBMIT), roomId=('content', 'body', 2, 'value'))
+
+VOTING = CardTemplate(_card([
+    {"type": "TextBlock", "text": "Have your say on the poll below!", "size": "large"},
+    {"type": "TextBlock", "text": None, "size": "medium"},
+    {"type": "TextBlock", "text": None, "weight": "bolder"},
+    _room_input(),
+    {"type": "Input.ChoiceSet", "id": "poll_choice", "style": "expanded", "value": "1", "choices": []}
+], _SUBMIT), name=('content', 'body', 1, 'text'), description=('content', 'body', 2, 'text'),
+    roomId=('content', 'body', 3, 'value'), choices=('content', 'body', 4, 'choices'))
+
+RESULTS = CardTemplate(_card([
+    {"type": "TextBlock", "text": "Below are the results!", "size": "large"},
+    _room_input()
+], []), roomId=('content', 'body', 1, 'value'))
+
+
+def start_poll_card(room_id):
+    return START_POLL.fill(roomId=room_id)
+
+
+def add_option_card(room_id):
+    return ADD_OPTION.fill(roomId=room_id)
+
+
+def results_card(room_id, results):
+    card = RESULTS.fill(roomId=room_id)
+    body = card["content"]["body"]
+    body += [{"type": "TextBlock", "text": option + ": *" + str(total) + "*"} for option, total in results.items()]
+    return card
+
+
+class VotingCardCache:
+    """Keeps the last encoded voting card per room and reuses it while the poll is unchanged."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, poll):
+        options = poll.options
+        version = (poll.name, poll.description, tuple(options.items()))
+        with self._lock:
+            cached = self._cards.get(poll.room_id)
+            if cached is not None and cached[0] == version:
+                self._cards.move_to_end(poll.room_id)
+                return cached[1]
+        card = EncodedCard(VOTING.fill(
+            name=poll.name, description=poll.description, roomId=poll.room_id,
+            choices=[{"title": option, "value": str(value)} for value, option in options.items()]))
+        with self._lock:
+            self._cards[poll.room_id] = (version, card)
+            self._cards.move_to_end(poll.room_id)
+            while len(self._cards) > self.maxsize:
+                self._cards.popitem(last=False)
+        return card
+
+
+voting_cards = VotingCardCache()
@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def event_key(payload):
+    # Webex reuses the resource id (message, attachment action...) when it redelivers an event
+    return f"{payload.get('resource')}:{payload.get('event')}:{payload['data'].get('id')}"
+
+
+class SeenEvents:
+    """Bounded, time-windowed record of webhook events that were already accepted.
+
+    Kept as an LRU with a TTL in memory. When given a Redis-protocol client the
+    window is also kept on the server (SET NX EX), so every worker shares it.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600, client=None, prefix='seen'):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.client = client
+        self.prefix = prefix
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def first_time(self, key):
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._seen.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._seen[key] = now + self.ttl
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+        if self.client is not None:
+            try:
+                claimed = self.client.execute('SET', f'{self.prefix}:{key}', 1, 'NX', 'EX', self.ttl)
+            except Exception:
+                # Not recorded anywhere, so the redelivery must not look like a duplicate
+                with self._lock:
+                    self._seen.pop(key, None)
+                raise
+            if claimed is None:
+                return False
+        return True
+
+    def forget(self, key):
+        # The event could not be queued, so let its redelivery through
+        with self._lock:
+            self._seen.pop(key, None)
+        if self.client is not None:
+            self.client.execute('DEL', f'{self.prefix}:{key}')
@@ -0,0 +1,157 @@
+import functools
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from webexpythonsdk import WebexAPI
+from webexpythonsdk.exceptions import ApiError, RateLimitError
+
+from common.cards import EncodedCard
+
+
+def pooled_api(access_token, pool_size=20, wait_on_rate_limit=False, base_url=None, adapter=None):
+    # One keep-alive connection pool shared by every outbound call, and by several bots when given their adapter
+    kwargs = {'base_url': base_url} if base_url else {}
+    teams_api = WebexAPI(access_token=access_token, wait_on_rate_limit=wait_on_rate_limit, **kwargs)
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    teams_api._session._req_session.mount('https://', adapter)
+    teams_api._session._req_session.mount('http://', adapter)
+    return teams_api
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif not self.rate:
+                    # No local limit, only the back-off Webex asked for
+                    return
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def block(self, seconds):
+        # Webex told us to back off, so hold every caller of this endpoint
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class Dispatcher:
+    """Central outbound queue for Webex calls with per-endpoint rate limiting and retries.
+
+    Calls for the same recipient go through the same sender thread so they keep their order.
+    With no rate, calls are only held back when Webex answers 429, for as long
+    as its Retry-After says.
+    """
+
+    def __init__(self, teams_api, senders=16, rate=None, burst=20, limits=None, max_retries=5, backoff=0.5,
+                 metrics=None):
+        self.teams_api = teams_api
+        self.metrics = metrics
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._queues = [queue.Queue() for _ in range(senders)]
+        for i, q in enumerate(self._queues):
+            threading.Thread(target=self._run, args=(q,), name=f'webex-sender-{i}', daemon=True).start()
+
+    def send(self, endpoint, wait=False, **kwargs):
+        future = Future()
+        recipient = kwargs.get('roomId') or kwargs.get('toPersonEmail') or kwargs.get('toPersonId') or endpoint
+        self._queues[hash(recipient) % len(self._queues)].put((endpoint, kwargs, future))
+        if wait:
+            return future.result()
+        return future
+
+    def create_message(self, wait=False, **kwargs):
+        return self.send('messages.create', wait=wait, **kwargs)
+
+    def pending(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def _bucket(self, endpoint):
+        with self._buckets_lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                rate, burst = self.limits.get(endpoint, (self.rate, self.burst))
+                bucket = self._buckets[endpoint] = TokenBucket(rate, burst)
+            return bucket
+
+    def _run(self, q):
+        while True:
+            endpoint, kwargs, future = q.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._call(endpoint, kwargs))
+            except Exception as e:
+                future.set_exception(e)
+                print(f"Webex call {endpoint} failed: {e}")
+
+    def _method(self, endpoint, kwargs):
+        attachments = kwargs.get('attachments')
+        if endpoint == 'messages.create' and attachments and all(isinstance(a, EncodedCard) for a in attachments):
+            return self._post_encoded_message
+        return functools.reduce(getattr, endpoint.split('.'), self.teams_api)
+
+    def _post_encoded_message(self, attachments, **fields):
+        # Splice the cached card JSON into the body instead of encoding the card again
+        head = json.dumps(fields)[:-1] + (', ' if fields else '')
+        body = head + '"attachments": [' + ','.join(a.encoded for a in attachments) + ']}'
+        return self.teams_api._session.post('messages', data=body.encode())
+
+    def _call(self, endpoint, kwargs):
+        method = self._method(endpoint, kwargs)
+        if self.metrics is not None:
+            method = self.metrics.track_call(endpoint, method)
+        bucket = self._bucket(endpoint)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                return method(**kwargs)
+            except RateLimitError as e:
+                error = e
+                # Jitter so the blocked senders don't all wake up together
+                bucket.block(e.retry_after + random.uniform(0, 1))
+                delay = 0
+            except ApiError as e:
+                if e.status_code < 500:
+                    raise
+                error = e
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            except requests.RequestException as e:
+                error = e
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            time.sleep(delay)
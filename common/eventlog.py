@@ -0,0 +1,96 @@
+"""Append-only JSONL log of inbound webhooks, for replaying them later.
+
+Webhooks only carry ids, so record_api() also logs what the bot fetched for
+them (message text, card inputs, people) and a replay can serve the same
+answers from bench.fake_webex. Each line is {"t": epoch seconds, "kind": ...,
+"data": ...} where kind is 'webhook' or the SDK endpoint, e.g. 'messages.get'.
+Bots sharing a log through common.host write through for_bot(name), which
+adds "bot": name to their lines.
+"""
+import json
+import threading
+import time
+
+RECORDED_ENDPOINTS = ('messages.get', 'attachment_actions.get', 'people.get', 'people.me')
+
+
+class EventLog:
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        threading.Thread(target=self._flush_loop, name='event-log', daemon=True).start()
+
+    def append(self, kind, data, bot=None):
+        entry = {'t': time.time(), 'kind': kind, 'data': data}
+        if bot is not None:
+            entry['bot'] = bot
+        line = json.dumps(entry, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def for_bot(self, bot):
+        return BotEventLog(self, bot)
+
+    def record_api(self, teams_api, bot=None):
+        for endpoint in RECORDED_ENDPOINTS:
+            api_name, method = endpoint.split('.')
+            api = getattr(teams_api, api_name)
+            setattr(api, method, self._recording(endpoint, getattr(api, method), bot))
+        return teams_api
+
+    def _recording(self, endpoint, fn, bot):
+        def wrapper(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            self.append(endpoint, result.json_data, bot)
+            return result
+        return wrapper
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._file.close()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except ValueError:
+                return  # closed underneath us
+
+
+class BotEventLog:
+    """One bot's view of a shared EventLog, tagging what it appends with the bot's name."""
+
+    def __init__(self, log, bot):
+        self.log = log
+        self.bot = bot
+
+    def append(self, kind, data):
+        self.log.append(kind, data, self.bot)
+
+    def record_api(self, teams_api):
+        return self.log.record_api(teams_api, self.bot)
+
+
+def read_events(path, bot=None):
+    """Yields (t, kind, data) for every entry, skipping a torn last line.
+
+    With bot, only that bot's entries from a shared log are yielded, along with
+    untagged ones from a single bot's log.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if bot is not None and entry.get('bot', bot) != bot:
+                continue
+            yield entry['t'], entry['kind'], entry['data']
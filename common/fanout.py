@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fan_out(items, fn, concurrency=8, on_progress=None, progress_every=500):
+    """Call fn on every item with at most `concurrency` calls in flight.
+
+    fn returns True when it sent something and False when it skipped the item;
+    an exception counts as a failure. Returns the final sent/failed/skipped counts.
+    """
+    counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def done(future):
+        if future.exception() is not None:
+            outcome = 'failed'
+        elif future.result():
+            outcome = 'sent'
+        else:
+            outcome = 'skipped'
+        with lock:
+            counts[outcome] += 1
+            total = sum(counts.values())
+            snapshot = dict(counts)
+        slots.release()
+        if on_progress and total % progress_every == 0:
+            on_progress(snapshot)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Items are pulled lazily so paged API listings are never fully materialised
+        for item in items:
+            slots.acquire()
+            pool.submit(fn, item).add_done_callback(done)
+    return counts
@@ -0,0 +1,92 @@
+"""Serve several bots from one process and one HTTP server.
+
+    BOTS=echo,poll,notes ECHO_BOT_TOKEN=... POLL_BOT_TOKEN=... NOTES_BOT_TOKEN=... python -m common.host
+
+Each bot is a plugin: a module built on common.bot, with a Flask app, a
+WEBHOOKS list and a setup(access_token, shared_workers, adapter, event_log)
+function. Every bot keeps its own token, identity and webhooks, and its app is
+mounted under /<bot name>, so the poll bot's card actions arrive at
+/poll/attachmentActions_webhook. All of them share one worker pool, one
+keep-alive connection pool to Webex, one /metrics page and, with
+EVENT_LOG_PATH set, one event log whose lines carry the bot's name. A module
+holds a single bot, so each plugin can be loaded once.
+"""
+import importlib
+import os
+
+from dotenv import load_dotenv
+from flask import Flask
+from requests.adapters import HTTPAdapter
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+from common.bot import EVENT_LOG_PATH, WEBEX_SENDERS, metrics_response
+from common.eventlog import EventLog
+from common.utils import get_ngrok_url, reconcile_webhooks
+from common.workers import WorkerPool
+
+PLUGINS = {
+    'echo': 'task1',
+    'anonymous-poll': 'task2',
+    'poll': 'task3',
+    'notes': 'task4',
+}
+
+
+class BotHost:
+    def __init__(self, bots, workers=4, queue_size=1000, pool_size=None):
+        # bots maps a name from PLUGINS to that bot's access token
+        self.workers = WorkerPool(workers, queue_size)
+        # Every bot's senders and the shared workers all call the same Webex host, so by default
+        # the pool keeps a connection for each of them rather than opening and dropping extras
+        pool_size = pool_size or len(bots) * (WEBEX_SENDERS + workers)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.event_log = EventLog(EVENT_LOG_PATH) if EVENT_LOG_PATH else None
+        self.bots = {}
+        for name, token in bots.items():
+            if name not in PLUGINS:
+                raise ValueError(f"Unknown bot '{name}', expected one of: {', '.join(PLUGINS)}")
+            bot = importlib.import_module(PLUGINS[name])
+            bot.setup(token, shared_workers=self.workers, adapter=self.adapter,
+                      event_log=self.event_log.for_bot(name) if self.event_log else None)
+            self.bots[name] = bot
+
+    def app(self):
+        app = Flask(__name__)
+        app.add_url_rule('/stats', 'stats', self.workers.stats)
+        app.add_url_rule('/metrics', 'metrics', self.metrics)
+        app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {f'/{name}': bot.app for name, bot in self.bots.items()})
+        return app
+
+    def metrics(self):
+        return metrics_response({name: bot.metrics for name, bot in self.bots.items()})
+
+    def register_webhooks(self, public_url=None):
+        public_url = (public_url or get_ngrok_url()).rstrip('/')
+        for name, bot in self.bots.items():
+            # Each bot's webhooks belong to its own token, so the names can stay the same
+            reconcile_webhooks(bot.teams_api, [(hook[0], f'/{name}{hook[1]}', *hook[2:]) for hook in bot.WEBHOOKS],
+                               public_url)
+
+
+def tokens_from_env(names):
+    # e.g. 'anonymous-poll' reads ANONYMOUS_POLL_BOT_TOKEN
+    tokens = {}
+    for name in names:
+        variable = name.upper().replace('-', '_') + '_BOT_TOKEN'
+        tokens[name] = os.getenv(variable)
+        if not tokens[name]:
+            raise ValueError(f"{variable} is not set correctly in the environment variables")
+    return tokens
+
+
+def main():
+    load_dotenv()
+    names = [name.strip() for name in os.getenv('BOTS', 'echo,poll,notes').split(',') if name.strip()]
+    host = BotHost(tokens_from_env(names), int(os.getenv('WEBHOOK_WORKERS', '4')),
+                   int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000')))
+    host.register_webhooks(os.getenv('PUBLIC_URL'))
+    host.app().run(host='0.0.0.0', port=int(os.getenv('PORT', '12000')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Lookup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.email = None
+        self.error = None
+
+
+class IdentityCache:
+    """Bot identity resolved once, plus a bounded LRU of personId -> email with TTL."""
+
+    def __init__(self, teams_api, maxsize=4096, ttl=600):
+        self.teams_api = teams_api
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.me = teams_api.people.me()
+        self.me_id = self.me.id
+        self._emails = OrderedDict()  # personId -> (expires_at, email)
+        self._in_flight = {}  # personId -> _Lookup shared by concurrent callers
+        self._lock = threading.Lock()
+
+    def is_me(self, person_id):
+        return person_id == self.me_id
+
+    def mention_names(self):
+        # Names a mention of the bot can start with, longest first
+        names = {getattr(self.me, field, None) for field in ('displayName', 'nickName', 'firstName')}
+        return sorted(filter(None, names), key=len, reverse=True)
+
+    def remember(self, person_id, email):
+        with self._lock:
+            self._store(person_id, email)
+
+    def cached_email(self, person_id):
+        # None when the email would need a Webex lookup
+        with self._lock:
+            entry = self._emails.get(person_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._emails.move_to_end(person_id)
+                return entry[1]
+        return None
+
+    def get_email(self, person_id):
+        with self._lock:
+            entry = self._emails.get(person_id)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._emails.move_to_end(person_id)
+                    return entry[1]
+                del self._emails[person_id]
+            lookup = self._in_flight.get(person_id)
+            owner = lookup is None
+            if owner:
+                lookup = self._in_flight[person_id] = _Lookup()
+
+        if not owner:
+            # Someone else is already asking Webex about this person
+            lookup.done.wait()
+            if lookup.error is not None:
+                raise lookup.error
+            return lookup.email
+
+        try:
+            lookup.email = self.teams_api.people.get(person_id).emails[0]
+        except Exception as e:
+            lookup.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[person_id]
+                if lookup.error is None:
+                    self._store(person_id, lookup.email)
+            lookup.done.set()
+        return lookup.email
+
+    def _store(self, person_id, email):
+        self._emails[person_id] = (time.monotonic() + self.ttl, email)
+        self._emails.move_to_end(person_id)
+        while len(self._emails) > self.maxsize:
+            self._emails.popitem(last=False)
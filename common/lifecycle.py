@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+import time
+
+from common.poll import PollSummary
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived_polls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    author TEXT NOT NULL,
+    results TEXT NOT NULL,
+    voter_count INTEGER NOT NULL,
+    ended REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_polls_room ON archived_polls (room_id, name COLLATE NOCASE, ended);
+"""
+
+
+class PollArchive:
+    """Results of ended polls kept in SQLite, so they stay queryable without the polls in memory.
+
+    Only a PollSummary is stored: the final counts and how many people voted,
+    not who they were.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, summary, ended=None):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT INTO archived_polls (room_id, name, description, author, results, voter_count, ended)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (summary.room_id, summary.name, summary.description, summary.author, json.dumps(summary.results),
+                 summary.voter_count, ended or time.time()))
+
+    def find(self, room_id, name):
+        # The latest poll in the room with that name, ignoring case
+        with self._lock:
+            row = self._db.execute(
+                'SELECT name, description, room_id, author, results, voter_count FROM archived_polls'
+                ' WHERE room_id = ? AND name = ? COLLATE NOCASE ORDER BY ended DESC LIMIT 1',
+                (room_id, name.strip())).fetchone()
+        if row is None:
+            return None
+        results = tuple((option, count) for option, count in json.loads(row[4]))
+        return PollSummary(row[0], row[1], row[2], row[3], results, row[5])
+
+    def recent(self, room_id, limit=5):
+        # (name, ended) of the room's latest archived polls, newest first
+        with self._lock:
+            return self._db.execute('SELECT name, ended FROM archived_polls WHERE room_id = ?'
+                                    ' ORDER BY ended DESC LIMIT ?', (room_id, limit)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IdleTracker:
+    """Calls on_idle(room_id) once a room's poll has gone ttl seconds without being used.
+
+    touch() only records the time. Each room has one 'idle' job on the shared
+    scheduler that checks back when the ttl would run out and pushes itself
+    back if the poll was used meanwhile, so a busy poll costs a dict write per
+    event rather than a reschedule. After a restart the clock starts again from
+    the first check. A ttl of 0 turns it off.
+    """
+
+    def __init__(self, scheduler, ttl, on_idle):
+        self.scheduler = scheduler
+        self.ttl = ttl
+        self.on_idle = on_idle
+        self._last_used = {}
+        scheduler.on('idle')(self._check)
+
+    def touch(self, room_id):
+        if not self.ttl:
+            return
+        now = time.time()
+        first = room_id not in self._last_used
+        self._last_used[room_id] = now
+        if first:
+            self.scheduler.schedule(f'idle:{room_id}', now + self.ttl, 'idle', room_id)
+
+    def forget(self, room_id):
+        self._last_used.pop(room_id, None)
+        self.scheduler.cancel(f'idle:{room_id}')
+
+    def _check(self, room_id):
+        now = time.time()
+        last_used = self._last_used.setdefault(room_id, now)
+        if last_used + self.ttl > now:
+            self.scheduler.schedule(f'idle:{room_id}', last_used + self.ttl, 'idle', room_id)
+        else:
+            self._last_used.pop(room_id, None)
+            self.on_idle(room_id)
@@ -0,0 +1,54 @@
+import threading
+import time
+
+
+class LiveResults:
+    """Edits one results message per room in place, coalescing bursts of updates.
+
+    touch() only marks a room dirty; a single background thread edits each
+    dirty room at most once per debounce window. lookup(room_id) returns
+    (message_id, markdown) for the room, or None once there is nothing to show.
+    """
+
+    def __init__(self, dispatcher, lookup, debounce=2.0):
+        self.dispatcher = dispatcher
+        self.lookup = lookup
+        self.debounce = debounce
+        self.edits = 0
+        self._due = {}
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name='live-results', daemon=True).start()
+
+    def touch(self, room_id):
+        with self._cond:
+            if room_id not in self._due:
+                self._due[room_id] = time.monotonic() + self.debounce
+                self._cond.notify()
+
+    def cancel(self, room_id):
+        with self._cond:
+            self._due.pop(room_id, None)
+
+    def flush(self, room_id):
+        self.cancel(room_id)
+        found = self.lookup(room_id)
+        if found is None or found[0] is None:
+            return
+        message_id, markdown = found
+        self.edits += 1
+        self.dispatcher.send('messages.update', messageId=message_id, roomId=room_id, markdown=markdown)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due:
+                    self._cond.wait()
+                room_id, due = min(self._due.items(), key=lambda item: item[1])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            try:
+                self.flush(room_id)
+            except Exception as e:
+                print(f"Failed to refresh live results for {room_id}: {e}")
@@ -0,0 +1,170 @@
+"""Latency histograms and error counts, rendered in the Prometheus text format.
+
+Everything is a no-op when the Metrics object is disabled: timed() hands back
+the undecorated function and instrument_api() leaves the SDK untouched.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import nullcontext
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SDK_ENDPOINTS = {
+    'messages': ('get', 'list', 'create', 'update', 'delete'),
+    'people': ('me', 'get', 'list'),
+    'memberships': ('get', 'list'),
+    'attachment_actions': ('get',),
+    'rooms': ('get', 'list'),
+    'webhooks': ('get', 'list', 'create', 'update', 'delete'),
+}
+HELP = {
+    'bot_route_seconds': 'Time spent in each Flask webhook route',
+    'bot_handler_seconds': 'Time spent handling one webhook event in a worker',
+    'bot_command_seconds': 'Time spent in each bot command',
+    'webex_api_call_seconds': 'Latency of Webex API calls by SDK endpoint',
+    'webex_api_errors_total': 'Failed Webex API calls by SDK endpoint and status code',
+}
+_NOOP = nullcontext()
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}' if labels else ''
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._histograms = {}  # name -> {labels tuple: _Histogram}
+        self._counters = {}  # name -> {labels tuple: int}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram.total += seconds
+            histogram.count += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return _NOOP
+        return _Timer(self, name, labels)
+
+    def timed(self, name, **labels):
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, name, labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def track_call(self, endpoint, fn):
+        # Wraps one Webex call: latency per endpoint, and errors by status code
+        if not self.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                self.inc('webex_api_errors_total', endpoint=endpoint, status=getattr(e, 'status_code', None) or 'exception')
+                raise
+            finally:
+                self.observe('webex_api_call_seconds', time.perf_counter() - started, endpoint=endpoint)
+        return wrapper
+
+    def instrument_api(self, teams_api):
+        """Times every SDK call made through teams_api, e.g. `messages.get`."""
+        if not self.enabled:
+            return teams_api
+        for api_name, methods in SDK_ENDPOINTS.items():
+            api = getattr(teams_api, api_name, None)
+            for method in methods:
+                if api is not None and hasattr(api, method):
+                    setattr(api, method, self.track_call(f'{api_name}.{method}', getattr(api, method)))
+        return teams_api
+
+    def render(self):
+        return render_all({None: self})
+
+    def _snapshot(self, extra):
+        # extra labels go first in every series key
+        with self._lock:
+            counters = {name: {extra + key: value for key, value in series.items()}
+                        for name, series in self._counters.items()}
+            histograms = {name: {extra + key: (list(h.counts), h.total, h.count) for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+        return counters, histograms
+
+
+def render_all(metrics_by_bot, label='bot'):
+    """One exposition for several Metrics objects, e.g. every bot in a host, told apart by a label."""
+    counters, histograms = {}, {}
+    for bot, metrics in metrics_by_bot.items():
+        bot_counters, bot_histograms = metrics._snapshot(((label, bot),) if bot is not None else ())
+        for name, series in bot_counters.items():
+            counters.setdefault(name, {}).update(series)
+        for name, series in bot_histograms.items():
+            histograms.setdefault(name, {}).update(series)
+    lines = []
+    for name, series in sorted(counters.items()):
+        _header(lines, name, 'counter')
+        for key, value in sorted(series.items()):
+            lines.append(f'{name}{_labels(key)} {value}')
+    for name, series in sorted(histograms.items()):
+        _header(lines, name, 'histogram')
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_labels(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(key)} {total}')
+            lines.append(f'{name}_count{_labels(key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _header(lines, name, kind):
+    if name in HELP:
+        lines.append(f'# HELP {name} {HELP[name]}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
@@ -1,32 +1,153 @@
+from collections import namedtuple
+from collections.abc import MutableMapping
+
+from common.scheduler import parse_minutes
+from common.state import LocalPollState
+
+# What is left of a poll once it has ended: results is a tuple of (option, votes)
+PollSummary = namedtuple('PollSummary', 'name description room_id author results voter_count')
+
+
 class Poll:
-    def __init__(self, name, description, room_id, author):
+    __slots__ = ('name', 'description', 'room_id', 'author', 'state', '_started', 'live_message_id', 'duration',
+                 'reminders', 'deadline')
+
+    def __init__(self, name, description, room_id, author, state=None):
         self.name = name
         self.description = description
         self.room_id = room_id
         self.author = author
-        self.options = {}
-        self.votes = {}
-        self.voted_users = set()  # Track users who have voted
-        self._last_option_index_added = 1
-        self.started = False
+        self.state = state if state is not None else LocalPollState()
+        self._started = False
+        self.live_message_id = None
+        self.duration = None
+        self.reminders = ()
+        self.deadline = None
+        self.state.create_poll(room_id, self._meta())
+
+    @classmethod
+    def load(cls, state, room_id):
+        meta = state.get_poll(room_id)
+        if meta is None:
+            return None
+        poll = cls.__new__(cls)
+        poll.name = meta['name']
+        poll.description = meta['description']
+        poll.room_id = room_id
+        poll.author = meta['author']
+        poll.state = state
+        poll._started = meta['started']
+        poll.live_message_id = meta.get('live_message_id')
+        # Shared state backends hand every field back as a string
+        poll.duration = float(meta['duration']) if meta.get('duration') else None
+        poll.reminders = parse_minutes(meta.get('reminders'))
+        poll.deadline = float(meta['deadline']) if meta.get('deadline') else None
+        return poll
+
+    def _meta(self):
+        return {'name': self.name, 'description': self.description, 'author': self.author, 'started': self._started}
+
+    @property
+    def started(self):
+        return self._started
+
+    @started.setter
+    def started(self, value):
+        self._started = value
+        self.state.update_poll(self.room_id, started=value)
+
+    def set_live_message(self, message_id):
+        self.live_message_id = message_id
+        self.state.update_poll(self.room_id, live_message_id=message_id)
+
+    def set_timing(self, duration, reminders=()):
+        # duration in minutes, reminders in minutes before the deadline
+        self.duration = duration or None
+        self.reminders = tuple(m for m in reminders if self.duration and m < self.duration)
+        self.state.update_poll(self.room_id, duration=self.duration or '',
+                               reminders=','.join(str(m) for m in self.reminders))
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+        self.state.update_poll(self.room_id, deadline=deadline or '')
+
+    @property
+    def options(self):
+        return self.state.options(self.room_id)
+
+    @property
+    def votes(self):
+        return self.state.votes(self.room_id)
+
+    @property
+    def voter_count(self):
+        return self.state.voter_count(self.room_id)
+
+    def has_voted(self, user_email):
+        return self.state.has_voted(self.room_id, user_email)
 
     def add_option(self, option):
-        self.options[self._last_option_index_added] = option
-        self.votes[self._last_option_index_added] = 0
-        self._last_option_index_added += 1
+        return self.state.add_option(self.room_id, option)
 
     def vote(self, option_num, user_email):
-        if user_email in self.voted_users:
-            return False # if the user has already voted not allow for another to go through
-        self.votes[option_num] += 1
-        self.voted_users.add(user_email)
-        return True
-    
+        # check-and-add on the voter set and the increment happen in the state backend
+        return self.state.vote(self.room_id, option_num, user_email)
+
+    def count_vote(self, option_num):
+        # Anonymous vote with no per-user check, as the task2 bot allows
+        return self.state.incr_vote(self.room_id, option_num)
+
     def list_options(self):
         return self.options
-    
+
     def collate_results(self):
         results = {}
+        votes = self.votes
         for value, option in self.options.items():
-            results[option] = self.votes[value]
-        return results
\ No newline at end of file
+            results[option] = votes.get(value, 0)
+        return results
+
+    def freeze(self):
+        votes = self.votes
+        results = tuple((option, votes.get(num, 0)) for num, option in self.options.items())
+        return PollSummary(self.name, self.description, self.room_id, self.author, results, self.voter_count)
+
+
+class PollRegistry(MutableMapping):
+    """Dict-like view of every poll held in a state backend, keyed by room id."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def __getitem__(self, room_id):
+        poll = Poll.load(self.state, room_id)
+        if poll is None:
+            raise KeyError(room_id)
+        return poll
+
+    def __setitem__(self, room_id, poll):
+        if poll.state is not self.state:
+            raise ValueError('poll belongs to a different state backend')
+
+    def __delitem__(self, room_id):
+        if self.state.get_poll(room_id) is None:
+            raise KeyError(room_id)
+        self.state.delete_poll(room_id)
+
+    def __contains__(self, room_id):
+        return self.state.get_poll(room_id) is not None
+
+    def __iter__(self):
+        return iter(self.state.room_ids())
+
+    def __len__(self):
+        return len(self.state.room_ids())
+
+    def new_poll(self, name, description, room_id, author):
+        return Poll(name, description, room_id, author, self.state)
+
+    def end_poll(self, room_id):
+        # Keep only the final counts and drop the options, tallies and voters from the state
+        summary = self[room_id].freeze()
+        del self[room_id]
+        return summary
@@ -0,0 +1,223 @@
+"""Small in-memory Redis-protocol server for running the bots without a real Redis.
+
+Only the commands used by common.state and common.dedupe are implemented, and EVAL
+only runs the scripts from common.state, in Python. Start it with
+`python -m common.respserver --port 6379` and point POLL_STATE_URL at it.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+from common.state import VOTE_SCRIPT, RespError, encode_command
+
+
+class _Store:
+    def __init__(self, sweep_every=1000):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.sweep_every = sweep_every
+        self._commands = 0
+        self._scripts = {VOTE_SCRIPT: self._vote_script}
+
+    def execute(self, name, args):
+        handler = getattr(self, 'cmd_' + name.lower(), None)
+        if handler is None:
+            raise RespError(f"ERR unknown command '{name}'")
+        with self.lock:
+            self._expire(args)
+            return handler(*args)
+
+    def _expire(self, keys):
+        now = time.monotonic()
+        self._commands += 1
+        if self._commands % self.sweep_every == 0:
+            keys = list(self.expires)
+        for key in keys:
+            deadline = self.expires.get(key)
+            if deadline is not None and deadline <= now:
+                del self.expires[key]
+                self.data.pop(key, None)
+
+    def _typed(self, key, kind):
+        value = self.data.get(key)
+        if value is None:
+            value = self.data[key] = kind()
+        elif not isinstance(value, kind):
+            raise RespError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def cmd_ping(self, *args):
+        return Status(args[0] if args else 'PONG')
+
+    def cmd_select(self, db):
+        return Status('OK')
+
+    def cmd_flushall(self):
+        self.data.clear()
+        self.expires.clear()
+        return Status('OK')
+
+    def cmd_del(self, *keys):
+        for key in keys:
+            self.expires.pop(key, None)
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def cmd_get(self, key):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, str):
+            raise RespError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if ('NX' in options and key in self.data) or ('XX' in options and key not in self.data):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in (('EX', 1), ('PX', 0.001)):
+            if unit in options:
+                self.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        return Status('OK')
+
+    def cmd_incr(self, key):
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value)
+        return value
+
+    def cmd_hset(self, key, *pairs):
+        table = self._typed(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in table
+            table[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        return self._typed(key, dict).get(field) if key in self.data else None
+
+    def cmd_hgetall(self, key):
+        if key not in self.data:
+            return []
+        return [item for pair in self._typed(key, dict).items() for item in pair]
+
+    def cmd_hincrby(self, key, field, amount):
+        table = self._typed(key, dict)
+        value = int(table.get(field, 0)) + int(amount)
+        table[field] = str(value)
+        return value
+
+    def cmd_hdel(self, key, *fields):
+        if key not in self.data:
+            return 0
+        table = self._typed(key, dict)
+        return sum(table.pop(field, None) is not None for field in fields)
+
+    def cmd_sadd(self, key, *members):
+        members_set = self._typed(key, set)
+        before = len(members_set)
+        members_set.update(members)
+        return len(members_set) - before
+
+    def cmd_srem(self, key, *members):
+        if key not in self.data:
+            return 0
+        members_set = self._typed(key, set)
+        before = len(members_set)
+        members_set.difference_update(members)
+        return before - len(members_set)
+
+    def cmd_smembers(self, key):
+        return list(self._typed(key, set)) if key in self.data else []
+
+    def cmd_sismember(self, key, member):
+        return int(key in self.data and member in self._typed(key, set))
+
+    def cmd_scard(self, key):
+        return len(self._typed(key, set)) if key in self.data else 0
+
+    def cmd_eval(self, script, numkeys, *args):
+        handler = self._scripts.get(script)
+        if handler is None:
+            raise RespError('ERR only the scripts in common.state are supported')
+        return handler(*args)
+
+    def _vote_script(self, options, voters, votes, num, amount, *voter):
+        if self.cmd_hget(options, num) is None:
+            return None
+        if voter and self.cmd_sadd(voters, *voter) == 0:
+            return -1
+        return self.cmd_hincrby(votes, num, amount)
+
+
+class Status(str):
+    pass
+
+
+def encode_reply(value):
+    if isinstance(value, RespError):
+        return b'-%s\r\n' % str(value).encode()
+    if isinstance(value, Status):
+        return b'+%s\r\n' % value.encode()
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, list):
+        return encode_command(value)
+    data = value.encode()
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+def read_command(stream):
+    line = stream.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline command, e.g. from telnet
+        return line.decode().split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int(stream.readline()[1:-2])
+        args.append(stream.read(size + 2)[:-2].decode())
+    return args
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            args = read_command(self.rfile)
+            if args is None:
+                return
+            if not args:
+                continue
+            try:
+                reply = self.server.store.execute(args[0], args[1:])
+            except RespError as e:
+                reply = e
+            except (TypeError, ValueError) as e:
+                reply = RespError(f'ERR {e}')
+            self.wfile.write(encode_reply(reply))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self.store = _Store()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+    server = RespServer((args.host, args.port))
+    print(f'Listening on {args.host}:{args.port}')
+    server.serve_forever()
@@ -0,0 +1,73 @@
+import threading
+
+
+class Roster:
+    """Member emails of each room, listed from Webex once and then kept current from membership webhooks.
+
+    The bot itself is left out. A room is listed the first time it is asked
+    about; membership events for rooms that haven't been listed yet are
+    ignored, since the listing will include them. Events for a room wait for a
+    listing in progress, so neither one overwrites the other.
+
+    With cache=False every question lists the room again, for processes that
+    don't receive all of the membership events.
+    """
+
+    def __init__(self, teams_api, bot_id, cache=True):
+        self.teams_api = teams_api
+        self.bot_id = bot_id
+        self.cache = cache
+        self._rooms = {}  # room_id -> set of member emails
+        self._room_locks = {}
+        self._lock = threading.Lock()
+
+    def _room_lock(self, room_id):
+        with self._lock:
+            lock = self._room_locks.get(room_id)
+            if lock is None:
+                lock = self._room_locks[room_id] = threading.Lock()
+            return lock
+
+    def _list(self, room_id):
+        return {m.personEmail for m in self.teams_api.memberships.list(roomId=room_id) if m.personId != self.bot_id}
+
+    def _members(self, room_id):
+        if not self.cache:
+            return self._list(room_id)
+        members = self._rooms.get(room_id)
+        if members is None:
+            with self._room_lock(room_id):
+                members = self._rooms.get(room_id)
+                if members is None:
+                    members = self._rooms[room_id] = self._list(room_id)
+        return members
+
+    def count(self, room_id):
+        return len(self._members(room_id))
+
+    def members(self, room_id):
+        members = self._members(room_id)
+        if not self.cache:
+            return members
+        with self._room_lock(room_id):
+            return set(members)
+
+    def joined(self, room_id, person_id, email):
+        if person_id == self.bot_id:
+            return
+        with self._room_lock(room_id):
+            members = self._rooms.get(room_id)
+            if members is not None:
+                members.add(email)
+
+    def left(self, room_id, person_id, email):
+        if person_id == self.bot_id:
+            # The bot was removed, so there is nothing more to track in the room
+            with self._lock:
+                self._rooms.pop(room_id, None)
+                self._room_locks.pop(room_id, None)
+            return
+        with self._room_lock(room_id):
+            members = self._rooms.get(room_id)
+            if members is not None:
+                members.discard(email)
@@ -0,0 +1,62 @@
+class CommandRouter:
+    """Maps message text to handlers with one dict lookup.
+
+    Exact commands (`create poll`) are matched on the whole text and argument
+    commands (`/add <note>`) on their first word; both are case-insensitive.
+    Handlers receive whatever context dispatch() is given, and argument
+    commands get the rest of the text first.
+    """
+
+    def __init__(self, mention_names=(), metrics=None):
+        self.mention_names = mention_names
+        self.metrics = metrics
+        self._exact = {}
+        self._prefixes = {}
+        self._fallback = None
+
+    def command(self, *names):
+        def register(handler):
+            for name in names:
+                self._exact[' '.join(name.lower().split())] = handler
+            return handler
+        return register
+
+    def prefix(self, name):
+        def register(handler):
+            self._prefixes[name.lower()] = handler
+            return handler
+        return register
+
+    def fallback(self, handler):
+        self._fallback = handler
+        return handler
+
+    def commands(self):
+        return list(self._exact) + list(self._prefixes)
+
+    def strip_mention(self, text):
+        # In group spaces the message starts with the bot's name, e.g. "PollBot create poll"
+        lowered = text.lower()
+        for name in self.mention_names:
+            if lowered.startswith(name.lower()):
+                return text[len(name):].strip()
+        return text.strip()
+
+    def dispatch(self, text, *args, **kwargs):
+        text = self.strip_mention(text)
+        words = text.split()
+        handler = self._exact.get(' '.join(words).lower())
+        if handler is not None:
+            return self._run(handler, *args, **kwargs)
+        if words:
+            handler = self._prefixes.get(words[0].lower())
+            if handler is not None:
+                return self._run(handler, text[len(words[0]):].strip(), *args, **kwargs)
+        if self._fallback is not None:
+            return self._run(self._fallback, text, *args, **kwargs)
+
+    def _run(self, handler, *args, **kwargs):
+        if self.metrics is None:
+            return handler(*args, **kwargs)
+        with self.metrics.timer('bot_command_seconds', command=handler.__name__):
+            return handler(*args, **kwargs)
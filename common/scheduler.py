@@ -0,0 +1,128 @@
+import heapq
+import threading
+import time
+
+
+def parse_minutes(text):
+    # "60, 10" -> (60, 10); anything that isn't a positive number is ignored
+    minutes = set()
+    for part in str(text or '').replace(';', ',').split(','):
+        try:
+            value = float(part)
+        except ValueError:
+            continue
+        if value > 0:
+            minutes.add(int(value) if value.is_integer() else value)
+    return tuple(sorted(minutes, reverse=True))
+
+
+class Scheduler:
+    """One thread and one heap for every timed job, such as poll deadlines and reminders.
+
+    Jobs have a key so they can be replaced or cancelled. Cancelled entries stay
+    in the heap and are skipped when they come up. With a store, pending jobs
+    are written through as they change and reloaded by start(), so they survive a
+    restart; any that came due while the bot was down run straight away.
+    Handlers run on the scheduler thread and should hand slow work elsewhere.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._handlers = {}
+        self._jobs = {}  # key -> (due, kind, room_id)
+        self._rooms = {}  # room_id -> keys of its jobs
+        self._heap = []  # (due, key), possibly stale
+        self._cond = threading.Condition()
+
+    def on(self, kind):
+        def register(handler):
+            self._handlers[kind] = handler
+            return handler
+        return register
+
+    def start(self):
+        if self.store is not None:
+            with self._cond:
+                for key, due, kind, room_id in self.store.load_jobs():
+                    self._push(key, due, kind, room_id)
+        threading.Thread(target=self._run, name='scheduler', daemon=True).start()
+
+    def schedule(self, key, due, kind, room_id):
+        # due is a time.time() timestamp so it still means the same thing after a restart
+        with self._cond:
+            self._push(key, due, kind, room_id)
+            if self.store is not None:
+                self.store.save_job(key, due, kind, room_id)
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            job = self._jobs.pop(key, None)
+            if job is not None:
+                self._unlink(job[2], key)
+                if self.store is not None:
+                    self.store.delete_jobs([key])
+
+    def cancel_room(self, room_id):
+        with self._cond:
+            keys = self._rooms.pop(room_id, set())
+            for key in keys:
+                del self._jobs[key]
+            if keys and self.store is not None:
+                self.store.delete_jobs(list(keys))
+
+    def pending(self, room_id=None):
+        with self._cond:
+            if room_id is None:
+                return len(self._jobs)
+            return sorted(self._jobs[key][:2] for key in self._rooms.get(room_id, ()))
+
+    def _push(self, key, due, kind, room_id):
+        old = self._jobs.get(key)
+        if old is not None:
+            self._unlink(old[2], key)
+        self._jobs[key] = (due, kind, room_id)
+        self._rooms.setdefault(room_id, set()).add(key)
+        heapq.heappush(self._heap, (due, key))
+        if len(self._heap) > 2 * len(self._jobs) + 1024:
+            # Too many cancelled entries left behind, rebuild from the live jobs
+            self._heap = [(job[0], k) for k, job in self._jobs.items()]
+            heapq.heapify(self._heap)
+
+    def _unlink(self, room_id, key):
+        keys = self._rooms.get(room_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._rooms[room_id]
+
+    def _next_due(self):
+        # Called with the lock held; blocks until a job is due and returns it
+        while True:
+            while self._heap:
+                due, key = self._heap[0]
+                job = self._jobs.get(key)
+                if job is not None and job[0] == due:
+                    break
+                heapq.heappop(self._heap)
+            else:
+                self._cond.wait()
+                continue
+            delay = due - time.time()
+            if delay <= 0:
+                heapq.heappop(self._heap)
+                del self._jobs[key]
+                self._unlink(job[2], key)
+                return key, job
+            self._cond.wait(delay)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                key, (due, kind, room_id) = self._next_due()
+                if self.store is not None:
+                    self.store.delete_jobs([key])
+            try:
+                self._handlers[kind](room_id)
+            except Exception as e:
+                print(f"Scheduled {kind} for {room_id} failed: {e}")
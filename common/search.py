@@ -0,0 +1,107 @@
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+class NoteIndex:
+    """Per-user inverted index over notes, kept up to date as notes are added.
+
+    Each term maps to an array of the ids of the notes containing it, so a
+    query only walks the postings of its own terms, never the notes. Matches
+    are ranked by how many of the terms they contain, then by the terms'
+    rarity (idf), then newest first. Note ids are whatever the caller uses to
+    find the note again and must increase as notes are added.
+
+    With a loader, the index only keeps the max_users most recently searched
+    users and builds the others on their next search from loader(user), an
+    iterable of (note_id, text) read from wherever the notes are stored.
+    """
+
+    def __init__(self, max_users=None, loader=None):
+        self.max_users = max_users
+        self.loader = loader
+        self._users = OrderedDict()  # user -> (term -> array of note ids, [note count])
+        self._loading = {}  # user -> notes added while the user's index is being built
+        self._lock = threading.Lock()
+
+    def add(self, user, note_id, text):
+        with self._lock:
+            entry = self._users.get(user)
+            if entry is None:
+                if self.loader is not None:
+                    # Not indexed yet, the note is read back with the rest on the next search
+                    if user in self._loading:
+                        self._loading[user].append((note_id, text))
+                    return
+                entry = self._users[user] = ({}, [0])
+            self._index(entry, note_id, text)
+
+    @staticmethod
+    def _index(entry, note_id, text):
+        postings, count = entry
+        for term in set(tokenize(text)):
+            ids = postings.get(term)
+            if ids is None:
+                ids = postings[term] = array('q')
+            ids.append(note_id)
+        count[0] += 1
+
+    def _load(self, user):
+        with self._lock:
+            self._loading.setdefault(user, [])
+        entry = ({}, [0])
+        last_id = None
+        for note_id, text in self.loader(user):
+            self._index(entry, note_id, text)
+            last_id = note_id
+        with self._lock:
+            added = self._loading.pop(user, None)
+            if added is None:
+                # Cleared meanwhile, or another search got here first
+                return
+            for note_id, text in added:
+                if last_id is None or note_id > last_id:
+                    self._index(entry, note_id, text)
+            self._users[user] = entry
+            if self.max_users is not None and len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def clear(self, user):
+        with self._lock:
+            self._users.pop(user, None)
+            self._loading.pop(user, None)
+
+    def __contains__(self, user):
+        return user in self._users
+
+    def search(self, user, query, limit=10):
+        # Returns up to limit note ids, best match first
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        if self.loader is not None and user not in self._users:
+            self._load(user)
+        with self._lock:
+            entry = self._users.get(user)
+            if entry is None:
+                return []
+            self._users.move_to_end(user)
+            postings, (count,) = entry
+            matches = [(term, postings[term]) for term in terms if term in postings]
+            scores = {}
+            for term, ids in matches:
+                idf = math.log(1 + count / len(ids))
+                for note_id in ids:
+                    hits, weight = scores.get(note_id, (0, 0.0))
+                    scores[note_id] = (hits + 1, weight + idf)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [note_id for note_id, _ in best]
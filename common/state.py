@@ -0,0 +1,316 @@
+import hashlib
+import socket
+import threading
+from array import array
+from urllib.parse import urlparse
+
+
+def voter_key(voter):
+    # 8 byte digest of the voter instead of the whole email; collisions need billions of voters
+    return int.from_bytes(hashlib.blake2b(voter.encode(), digest_size=8).digest(), 'big')
+
+
+class _Room:
+    """Option n lives at index n - 1 of options and of the vote counters."""
+
+    __slots__ = ('lock', 'meta', 'options', 'votes', 'voters')
+
+    def __init__(self, meta, options=None, next_option=1, votes=None, voters=()):
+        self.lock = threading.Lock()
+        self.meta = dict(meta)
+        # Sized from the options too, in case next_option was stored behind them
+        size = max(next_option - 1, max(options or (), default=0))
+        self.options = [None] * size
+        self.votes = array('q', [0]) * size
+        for num, text in (options or {}).items():
+            self.options[num - 1] = text
+        for num, count in (votes or {}).items():
+            if 1 <= num <= len(self.votes):
+                self.votes[num - 1] = count
+        self.voters = {voter_key(voter) for voter in voters}
+
+    def slot(self, num):
+        # Choices come from card submissions, so only options that exist are counted
+        if not 1 <= num <= len(self.options) or self.options[num - 1] is None:
+            raise KeyError(num)
+        return num - 1
+
+
+class LocalPollState:
+    """In-process poll state. Each room has its own lock, so increments and voter
+    checks are atomic without votes in different rooms ever contending.
+
+    An optional PollStore receives every change so the state survives restarts.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._rooms = {}
+        self._rooms_lock = threading.Lock()
+        if store is not None:
+            for room_id, meta, options, next_option, votes, voters in store.load_polls():
+                self._rooms[room_id] = _Room(meta, options, next_option, votes, voters)
+
+    def _room(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            raise KeyError(room_id)
+        return room
+
+    def create_poll(self, room_id, meta):
+        with self._rooms_lock:
+            self._rooms[room_id] = _Room(meta)
+        if self.store is not None:
+            self.store.new_poll(room_id, meta)
+
+    def update_poll(self, room_id, **fields):
+        room = self._room(room_id)
+        with room.lock:
+            room.meta.update(fields)
+            # Written under the room lock so the store gets the updates in the same order
+            if self.store is not None:
+                self.store.save_meta(room_id, room.meta)
+
+    def get_poll(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        with room.lock:
+            return dict(room.meta)
+
+    def delete_poll(self, room_id):
+        with self._rooms_lock:
+            self._rooms.pop(room_id, None)
+        if self.store is not None:
+            self.store.delete_poll(room_id)
+
+    def room_ids(self):
+        with self._rooms_lock:
+            return list(self._rooms)
+
+    def add_option(self, room_id, text):
+        room = self._room(room_id)
+        with room.lock:
+            room.options.append(text)
+            room.votes.append(0)
+            num = len(room.options)
+            if self.store is not None:
+                self.store.add_option(room_id, num, text)
+        return num
+
+    def options(self, room_id):
+        room = self._room(room_id)
+        with room.lock:
+            return {num: text for num, text in enumerate(room.options, 1) if text is not None}
+
+    def incr_vote(self, room_id, option_num, amount=1):
+        room = self._room(room_id)
+        with room.lock:
+            i = room.slot(option_num)
+            room.votes[i] += amount
+            count = room.votes[i]
+        if self.store is not None:
+            for _ in range(amount):
+                self.store.record_vote(room_id, option_num)
+        return count
+
+    def vote(self, room_id, option_num, voter):
+        room = self._room(room_id)
+        key = voter_key(voter)
+        with room.lock:
+            if key in room.voters:
+                return False
+            room.votes[room.slot(option_num)] += 1
+            room.voters.add(key)
+        if self.store is not None:
+            self.store.record_vote(room_id, option_num, voter)
+        return True
+
+    def votes(self, room_id):
+        room = self._room(room_id)
+        with room.lock:
+            return {num: count for num, (text, count) in enumerate(zip(room.options, room.votes), 1)
+                    if text is not None}
+
+    def voter_count(self, room_id):
+        room = self._room(room_id)
+        with room.lock:
+            return len(room.voters)
+
+    def has_voted(self, room_id, voter):
+        room = self._room(room_id)
+        key = voter_key(voter)
+        with room.lock:
+            return key in room.voters
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Minimal Redis-protocol client with one persistent connection per thread."""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, timeout=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(parsed.hostname or '127.0.0.1', parsed.port or 6379, db)
+
+    def execute(self, *args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+        try:
+            conn[0].sendall(encode_command(args))
+            return read_reply(conn[1])
+        except (OSError, EOFError):
+            self._local.conn = None
+            raise
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        conn = self._local.conn = (sock, sock.makefile('rb'))
+        if self.db:
+            self.execute('SELECT', self.db)
+        return conn
+
+
+def encode_command(args):
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(out)
+
+
+def read_reply(stream):
+    line = stream.readline()
+    if not line:
+        raise EOFError('connection closed')
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode()
+    if kind == b'-':
+        raise RespError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        data = stream.read(size + 2)
+        return data[:-2].decode()
+    if kind == b'*':
+        size = int(rest)
+        if size < 0:
+            return None
+        return [read_reply(stream) for _ in range(size)]
+    raise RespError(f'unexpected reply {line!r}')
+
+
+# KEYS: options, voters, votes; ARGV: option, amount[, voter]. Returns nil for an option that
+# doesn't exist, -1 when the voter already voted, else the option's new count
+VOTE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return false
+end
+if ARGV[3] and redis.call('SADD', KEYS[2], ARGV[3]) == 0 then
+    return -1
+end
+return redis.call('HINCRBY', KEYS[3], ARGV[1], ARGV[2])
+"""
+
+
+class RespPollState:
+    """Poll state kept in a Redis-protocol server so every worker and node sees the same poll.
+
+    A vote checks the option, adds the voter and bumps the count in one script,
+    so it is atomic on the server and a failed check leaves nothing behind.
+    """
+
+    def __init__(self, client, prefix='poll'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        return cls(RespClient.from_url(url))
+
+    def _key(self, room_id, part=None):
+        # The {room_id} hash tag puts all of a poll's keys in one cluster slot, as the vote script
+        # and the multi-key DELs need
+        key = f'{self.prefix}:{{{room_id}}}'
+        return key if part is None else f'{key}:{part}'
+
+    def create_poll(self, room_id, meta):
+        self.client.execute('DEL', self._key(room_id), self._key(room_id, 'options'),
+                            self._key(room_id, 'next_option'), self._key(room_id, 'votes'),
+                            self._key(room_id, 'voters'))
+        self.update_poll(room_id, **meta)
+        self.client.execute('SADD', f'{self.prefix}s', room_id)
+
+    def update_poll(self, room_id, **fields):
+        args = []
+        for field, value in fields.items():
+            args += [field, int(value) if isinstance(value, bool) else value]
+        self.client.execute('HSET', self._key(room_id), *args)
+
+    def get_poll(self, room_id):
+        reply = self.client.execute('HGETALL', self._key(room_id))
+        if not reply:
+            return None
+        meta = dict(zip(reply[::2], reply[1::2]))
+        meta['started'] = meta.get('started') == '1'
+        return meta
+
+    def delete_poll(self, room_id):
+        self.client.execute('DEL', self._key(room_id), self._key(room_id, 'options'),
+                            self._key(room_id, 'next_option'), self._key(room_id, 'votes'),
+                            self._key(room_id, 'voters'))
+        self.client.execute('SREM', f'{self.prefix}s', room_id)
+
+    def room_ids(self):
+        return self.client.execute('SMEMBERS', f'{self.prefix}s')
+
+    def add_option(self, room_id, text):
+        num = self.client.execute('INCR', self._key(room_id, 'next_option'))
+        self.client.execute('HSET', self._key(room_id, 'options'), num, text)
+        self.client.execute('HINCRBY', self._key(room_id, 'votes'), num, 0)
+        return num
+
+    def options(self, room_id):
+        reply = self.client.execute('HGETALL', self._key(room_id, 'options'))
+        return {int(num): text for num, text in sorted(zip(reply[::2], reply[1::2]), key=lambda item: int(item[0]))}
+
+    def _vote(self, room_id, option_num, amount, *voter):
+        count = self.client.execute('EVAL', VOTE_SCRIPT, 3, self._key(room_id, 'options'),
+                                    self._key(room_id, 'voters'), self._key(room_id, 'votes'),
+                                    option_num, amount, *voter)
+        if count is None:
+            raise KeyError(option_num)
+        return count
+
+    def incr_vote(self, room_id, option_num, amount=1):
+        return self._vote(room_id, option_num, amount)
+
+    def vote(self, room_id, option_num, voter):
+        return self._vote(room_id, option_num, 1, voter) != -1
+
+    def votes(self, room_id):
+        reply = self.client.execute('HGETALL', self._key(room_id, 'votes'))
+        return {int(num): int(count) for num, count in sorted(zip(reply[::2], reply[1::2]), key=lambda item: int(item[0]))}
+
+    def voter_count(self, room_id):
+        return self.client.execute('SCARD', self._key(room_id, 'voters'))
+
+    def has_voted(self, room_id, voter):
+        return self.client.execute('SISMEMBER', self._key(room_id, 'voters'), voter) == 1
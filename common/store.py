@@ -0,0 +1,297 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS polls (
+    room_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    author TEXT NOT NULL,
+    started INTEGER NOT NULL,
+    options TEXT NOT NULL,
+    next_option INTEGER NOT NULL,
+    votes TEXT NOT NULL DEFAULT '{}',
+    voters TEXT NOT NULL DEFAULT '[]',
+    snapshot_seq INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS vote_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id TEXT NOT NULL,
+    option_num INTEGER NOT NULL,
+    voter TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vote_log_room ON vote_log (room_id, seq);
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    due REAL NOT NULL,
+    kind TEXT NOT NULL,
+    room_id TEXT NOT NULL
+);
+"""
+META_COLUMNS = ('name', 'description', 'author', 'started')
+
+
+def _extra(meta):
+    # Meta fields without a column of their own, e.g. a poll's deadline settings
+    return json.dumps({key: value for key, value in meta.items() if key not in META_COLUMNS})
+
+
+class PollStore:
+    """SQLite (WAL) persistence for polls: a snapshot row per poll plus an append-only vote log.
+
+    Votes are buffered and committed in batches by a background thread, so
+    record_vote costs no more than a list append on the hot path. Once a
+    poll's log grows past compact_every rows it is folded into the snapshot,
+    which keeps startup proportional to the number of polls.
+    """
+
+    def __init__(self, path, flush_interval=0.05, batch_size=500, compact_every=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        if 'extra' not in {row[1] for row in self._db.execute('PRAGMA table_info(polls)')}:
+            self._db.execute("ALTER TABLE polls ADD COLUMN extra TEXT NOT NULL DEFAULT '{}'")
+        self._db_lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._log_sizes = {}
+        threading.Thread(target=self._run, name='poll-store-flusher', daemon=True).start()
+
+    def new_poll(self, room_id, meta):
+        # A fresh poll replaces whatever was stored for the room, votes included
+        self.flush()
+        with self._db_lock, self._db:
+            self._db.execute('DELETE FROM polls WHERE room_id = ?', (room_id,))
+            self._db.execute('DELETE FROM vote_log WHERE room_id = ?', (room_id,))
+            self._db.execute(
+                'INSERT INTO polls (room_id, name, description, author, started, options, next_option, extra)'
+                " VALUES (?, ?, ?, ?, ?, '[]', 1, ?)",
+                (room_id, meta['name'], meta['description'], meta['author'], int(meta['started']), _extra(meta)))
+        self._log_sizes.pop(room_id, None)
+
+    def save_meta(self, room_id, meta):
+        with self._db_lock, self._db:
+            self._db.execute('UPDATE polls SET name = ?, description = ?, author = ?, started = ?, extra = ?'
+                             ' WHERE room_id = ?',
+                             (meta['name'], meta['description'], meta['author'], int(meta['started']), _extra(meta),
+                              room_id))
+
+    def add_option(self, room_id, num, text):
+        with self._db_lock, self._db:
+            row = self._db.execute('SELECT options FROM polls WHERE room_id = ?', (room_id,)).fetchone()
+            if row is None:
+                return
+            options = json.loads(row[0]) + [[num, text]]
+            self._db.execute('UPDATE polls SET options = ?, next_option = MAX(next_option, ?) WHERE room_id = ?',
+                             (json.dumps(options), num + 1, room_id))
+
+    def record_vote(self, room_id, option_num, voter=''):
+        # An empty voter is an anonymous vote, which counts but isn't tracked
+        with self._pending_lock:
+            self._pending.append((room_id, option_num, voter))
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def delete_poll(self, room_id):
+        self.flush()
+        with self._db_lock, self._db:
+            self._db.execute('DELETE FROM polls WHERE room_id = ?', (room_id,))
+            self._db.execute('DELETE FROM vote_log WHERE room_id = ?', (room_id,))
+        self._log_sizes.pop(room_id, None)
+
+    def load_polls(self):
+        # Yields (room_id, meta, options, next_option, votes, voters) for every stored poll
+        self.flush()
+        polls = []
+        with self._db_lock:
+            rows = self._db.execute(
+                'SELECT room_id, name, description, author, started, options, next_option, votes, voters,'
+                ' snapshot_seq, extra FROM polls').fetchall()
+            for room_id, name, description, author, started, options, next_option, votes, voters, seq, extra in rows:
+                meta = json.loads(extra)
+                meta.update(name=name, description=description, author=author, started=bool(started))
+                options = {num: text for num, text in json.loads(options)}
+                counts = dict.fromkeys(options, 0)
+                counts.update((int(num), count) for num, count in json.loads(votes).items())
+                voters = set(json.loads(voters))
+                replayed = 0
+                for option_num, voter in self._db.execute(
+                        'SELECT option_num, voter FROM vote_log WHERE room_id = ? AND seq > ? ORDER BY seq',
+                        (room_id, seq)):
+                    counts[option_num] = counts.get(option_num, 0) + 1
+                    if voter:
+                        voters.add(voter)
+                    replayed += 1
+                self._log_sizes[room_id] = replayed
+                polls.append((room_id, meta, options, next_option, counts, voters))
+        return polls
+
+    def flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with self._db_lock, self._db:
+                self._db.executemany('INSERT INTO vote_log (room_id, option_num, voter) VALUES (?, ?, ?)', batch)
+        except sqlite3.Error:
+            # Keep the votes for the next attempt rather than dropping them
+            with self._pending_lock:
+                self._pending[:0] = batch
+            raise
+        for room_id, _, _ in batch:
+            self._log_sizes[room_id] = self._log_sizes.get(room_id, 0) + 1
+        for room_id, size in list(self._log_sizes.items()):
+            if size >= self.compact_every:
+                self.compact(room_id)
+
+    def compact(self, room_id):
+        # Fold the vote log into the poll's snapshot inside one transaction
+        with self._db_lock, self._db:
+            row = self._db.execute('SELECT votes, voters, snapshot_seq FROM polls WHERE room_id = ?',
+                                   (room_id,)).fetchone()
+            if row is None:
+                self._db.execute('DELETE FROM vote_log WHERE room_id = ?', (room_id,))
+            else:
+                votes = {int(num): count for num, count in json.loads(row[0]).items()}
+                voters = set(json.loads(row[1]))
+                last_seq = row[2]
+                for seq, option_num, voter in self._db.execute(
+                        'SELECT seq, option_num, voter FROM vote_log WHERE room_id = ? AND seq > ? ORDER BY seq',
+                        (room_id, last_seq)):
+                    votes[option_num] = votes.get(option_num, 0) + 1
+                    if voter:
+                        voters.add(voter)
+                    last_seq = seq
+                self._db.execute('UPDATE polls SET votes = ?, voters = ?, snapshot_seq = ? WHERE room_id = ?',
+                                 (json.dumps(votes), json.dumps(sorted(voters)), last_seq, room_id))
+                self._db.execute('DELETE FROM vote_log WHERE room_id = ? AND seq <= ?', (room_id, last_seq))
+        self._log_sizes[room_id] = 0
+
+    def save_job(self, key, due, kind, room_id):
+        with self._db_lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO jobs (key, due, kind, room_id) VALUES (?, ?, ?, ?)',
+                             (key, due, kind, room_id))
+
+    def delete_jobs(self, keys):
+        with self._db_lock, self._db:
+            self._db.executemany('DELETE FROM jobs WHERE key = ?', [(key,) for key in keys])
+
+    def load_jobs(self):
+        with self._db_lock:
+            return self._db.execute('SELECT key, due, kind, room_id FROM jobs').fetchall()
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Failed to flush poll votes: {e}")
+
+
+NOTES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    user TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    created INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (user, num)
+) WITHOUT ROWID;
+"""
+
+
+class NoteStore:
+    """SQLite (WAL) storage for the notes bot, clustered by user.
+
+    Notes are (num, created, content) tuples: num counts up from 1 per user
+    and created is a Unix timestamp in seconds. Nothing is loaded at startup;
+    the only thing held in memory is the note count of the cache_users most
+    recently active users, so memory stays flat however many notes there are.
+    """
+
+    def __init__(self, path, cache_users=1024, chunk_size=500):
+        self.cache_users = cache_users
+        self.chunk_size = chunk_size
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(NOTES_SCHEMA)
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()  # user -> number of notes, least recently used first
+
+    def _count(self, user):
+        # Called with the lock held
+        count = self._counts.get(user)
+        if count is None:
+            count = self._db.execute('SELECT COALESCE(MAX(num), 0) FROM notes WHERE user = ?', (user,)).fetchone()[0]
+            self._counts[user] = count
+            if len(self._counts) > self.cache_users:
+                self._counts.popitem(last=False)
+        else:
+            self._counts.move_to_end(user)
+        return count
+
+    def count(self, user):
+        with self._lock:
+            return self._count(user)
+
+    def add(self, user, content, created=None):
+        with self._lock, self._db:
+            num = self._count(user) + 1
+            self._db.execute('INSERT INTO notes (user, num, created, content) VALUES (?, ?, ?, ?)',
+                             (user, num, int(created if created is not None else time.time()), content))
+            self._counts[user] = num
+        return num
+
+    def clear(self, user):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM notes WHERE user = ?', (user,))
+            self._counts[user] = 0
+
+    def newest(self, user, skip, limit):
+        # Notes newest first, after skipping the skip newest ones
+        with self._lock:
+            top = self._count(user) - skip
+            return self._db.execute('SELECT num, created, content FROM notes WHERE user = ? AND num BETWEEN ? AND ?'
+                                    ' ORDER BY num DESC', (user, top - limit + 1, top)).fetchall()
+
+    def get(self, user, nums):
+        # The notes with these numbers, in the order given
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT num, created, content FROM notes WHERE user = ? AND num IN ({','.join('?' * len(nums))})",
+                (user, *nums)).fetchall()
+        found = {row[0]: row for row in rows}
+        return [found[num] for num in nums if num in found]
+
+    def iter_notes(self, user):
+        # Oldest first, chunk_size rows per query so neither the lock nor memory is held for long
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute('SELECT num, created, content FROM notes WHERE user = ? AND num > ?'
+                                        ' ORDER BY num LIMIT ?', (user, last, self.chunk_size)).fetchall()
+            yield from rows
+            if len(rows) < self.chunk_size:
+                return
+            last = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,17 +1,76 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
-def create_webhook(teams_api, name, webhook, resource):
-    delete_webhook(teams_api, name)
-    teams_api.webhooks.create(
-        name=name, targetUrl=get_ngrok_url()+webhook,
-        resource=resource, event='created', filter=None)
+def create_webhook(teams_api, name, webhook, resource, event='created'):
+    reconcile_webhooks(teams_api, [(name, webhook, resource, event)])
 
 def delete_webhook(teams_api, name):
     for hook in teams_api.webhooks.list():
         if hook.name == name:
             teams_api.webhooks.delete(hook.id)
 
+def reconcile_webhooks(teams_api, desired, public_url=None, max_workers=4):
+    # desired is a list of (name, path, resource), optionally followed by event and filter
+    timings = []
+    started = time.perf_counter()
+
+    def timed(label, fn, *args, **kwargs):
+        t = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings.append((label, time.perf_counter() - t))
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # The webhook list and the public URL don't depend on each other
+        existing = pool.submit(timed, 'list webhooks', lambda: list(teams_api.webhooks.list()))
+        if public_url is None:
+            public_url = timed('ngrok url', get_ngrok_url)
+        existing = existing.result()
+
+        by_name = {}
+        for hook in existing:
+            by_name.setdefault(hook.name, []).append(hook)
+
+        actions = []
+        for entry in desired:
+            name, path, resource = entry[:3]
+            event = entry[3] if len(entry) > 3 else 'created'
+            hook_filter = entry[4] if len(entry) > 4 else None
+            target = public_url.rstrip('/') + path
+            hooks = by_name.get(name, [])
+            # The filter can't be updated, so a hook with another one is replaced
+            keep = next((h for h in hooks if h.resource == resource and h.event == event
+                         and (getattr(h, 'filter', None) or None) == hook_filter), None)
+            for hook in hooks:
+                if hook is not keep:
+                    actions.append(('delete ' + name, teams_api.webhooks.delete, (hook.id,), {}))
+            if keep is None:
+                actions.append(('create ' + name, teams_api.webhooks.create, (),
+                                dict(name=name, targetUrl=target, resource=resource, event=event, filter=hook_filter)))
+            elif keep.targetUrl != target or getattr(keep, 'status', 'active') != 'active':
+                # Webex disables a hook after repeated delivery failures, e.g. while the bot was down
+                actions.append(('update ' + name, teams_api.webhooks.update, (keep.id,),
+                                dict(name=name, targetUrl=target, status='active')))
+            else:
+                timings.append(('unchanged ' + name, 0.0))
+
+        # Deletes go first so a recreated hook never overlaps the old one
+        deletes = [a for a in actions if a[0].startswith('delete')]
+        for future in [pool.submit(timed, label, fn, *args, **kwargs) for label, fn, args, kwargs in deletes]:
+            future.result()
+        others = [a for a in actions if not a[0].startswith('delete')]
+        for future in [pool.submit(timed, label, fn, *args, **kwargs) for label, fn, args, kwargs in others]:
+            future.result()
+
+    total = time.perf_counter() - started
+    print(f"Webhooks reconciled in {total * 1000:.0f} ms")
+    for label, elapsed in timings:
+        print(f"  {label}: {elapsed * 1000:.0f} ms")
+    return timings
+
 def get_ngrok_url(addr='127.0.0.1', port=4040):
     try:
         ngrokpage = requests.get("http://{}:{}/api/tunnels".format(addr, port), headers="").text
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class WorkerPool:
+    """Runs webhook handlers off the request thread so Flask can ack at once.
+
+    Handlers submitted with a key, e.g. a roomId, run one at a time and in
+    the order they were submitted, while different keys run in parallel. Only
+    one handler per key is in the shared queue at a time; the rest wait in the
+    key's backlog, and each finished handler sends the key's next one to the
+    back of the queue, so a busy room gets its turn like any other room
+    instead of holding on to a worker.
+    """
+
+    def __init__(self, num_workers=4, max_queue=1000):
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        # Unbounded so a worker can always requeue a key; submit() enforces max_queue
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._keyed = {}  # key -> backlog of handlers behind the one queued or running
+        self._backlog = 0
+        self._keys_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_time = 0.0
+        self._processing_time = 0.0
+        self._max_processing_time = 0.0
+        for i in range(num_workers):
+            threading.Thread(target=self._run, name=f'webhook-worker-{i}', daemon=True).start()
+
+    def submit(self, fn, *args, key=None):
+        if key is None:
+            return self._put((fn, args, time.monotonic(), None))
+        with self._keys_lock:
+            backlog = self._keyed.get(key)
+            if backlog is None:
+                if not self._put((fn, args, time.monotonic(), key)):
+                    return False
+                self._keyed[key] = deque()
+                return True
+            if self._full():
+                return False
+            backlog.append((fn, args, time.monotonic()))
+            self._backlog += 1
+            return True
+
+    def _put(self, item):
+        if self._full():
+            return False
+        self._queue.put_nowait(item)
+        return True
+
+    def _full(self):
+        if self._queue.qsize() + self._backlog < self.max_queue:
+            return False
+        with self._lock:
+            self.rejected += 1
+        return True
+
+    def join(self):
+        # Blocks until every queued handler has finished
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            done = self.processed + self.failed
+            return {
+                'workers': self.num_workers,
+                'queue_depth': self._queue.qsize(),
+                'keys_in_flight': len(self._keyed),
+                'key_backlog': self._backlog,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_wait_ms': 1000 * self._wait_time / done if done else 0.0,
+                'avg_processing_ms': 1000 * self._processing_time / done if done else 0.0,
+                'max_processing_ms': 1000 * self._max_processing_time,
+            }
+
+    def _run(self):
+        while True:
+            fn, args, enqueued_at, key = self._queue.get()
+            self._call(fn, args, enqueued_at)
+            if key is not None:
+                with self._keys_lock:
+                    backlog = self._keyed[key]
+                    if backlog:
+                        fn, args, enqueued_at = backlog.popleft()
+                        self._backlog -= 1
+                        self._queue.put_nowait((fn, args, enqueued_at, key))
+                    else:
+                        del self._keyed[key]
+            self._queue.task_done()
+
+    def _call(self, fn, args, enqueued_at):
+        started_at = time.monotonic()
+        ok = True
+        try:
+            fn(*args)
+        except Exception:
+            ok = False
+            traceback.print_exc()
+        elapsed = time.monotonic() - started_at
+        with self._lock:
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+            self._wait_time += started_at - enqueued_at
+            self._processing_time += elapsed
+            self._max_processing_time = max(self._max_processing_time, elapsed)
@@ -1,46 +1,50 @@
 from ctypes import util
-from flask import Flask, request
-from dotenv import load_dotenv
-import os
+import sys
 
-from common.utils import create_webhook
-from webexpythonsdk import WebexAPI, Webhook
+from common.bot import METRICS, create_app, run, setup_common, webhook_route
+from common.metrics import Metrics
+from common.router import CommandRouter
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Get the bot access token from the environment variable
-WEBEX_TEAMS_ACCESS_TOKEN = os.getenv('WEBEX_TEAMS_ACCESS_TOKEN')
-
-if not WEBEX_TEAMS_ACCESS_TOKEN:
-    raise ValueError("WEBEX_TEAMS_ACCESS_TOKEN is not set correctly in the environment variables")
+bot = sys.modules[__name__]   # common.bot sets the clients below on this module in setup()
 
 teams_api = None
-
-app = Flask(__name__)
-@app.route('/messages_webhook', methods=['POST'])
-def messages_webhook():
-    if request.method == 'POST':
-        webhook_obj = Webhook(request.json)
-        return process_message(webhook_obj.data)
-
+identity = None
+workers = None
+dispatcher = None
+seen_events = None
+event_log = None
+metrics = Metrics(METRICS)
+router = CommandRouter(metrics=metrics)
+
+app = create_app(bot)
+
+@webhook_route(bot, '/messages_webhook')
+@metrics.timed('bot_handler_seconds', handler='process_message')
 def process_message(data):
-    if data.personId == teams_api.people.me().id:
+    if identity.is_me(data.personId):
         # Message sent by bot, do not respond
         return '200'
     else:
         message = teams_api.messages.get(data.id).text
         print(message)
-        send_message_in_room(data.roomId, f"Hello {data.personEmail}!")
+        router.dispatch(message, data)
         return '200'
 
+@router.fallback
+def say_hello(message, data):
+    send_message_in_room(data.roomId, f"Hello {data.personEmail}!")
+
 def send_direct_message(person_email, message):
-    teams_api.messages.create(toPersonEmail=person_email, text=message)
+    dispatcher.create_message(toPersonEmail=person_email, text=message)
 
 def send_message_in_room(room_id, message):
-    teams_api.messages.create(roomId=room_id, text=message)
+    dispatcher.create_message(roomId=room_id, text=message)
+
+WEBHOOKS = [('messages_webhook', '/messages_webhook', 'messages')]
+
+def setup(access_token=None, shared_workers=None, adapter=None, event_log=None, base_url=None):
+    setup_common(bot, access_token, shared_workers, adapter, event_log=event_log, base_url=base_url)
+    return app
 
 if __name__ == '__main__':
-    teams_api = WebexAPI(access_token=WEBEX_TEAMS_ACCESS_TOKEN)
-    create_webhook(teams_api, 'messages_webhook', '/messages_webhook', 'messages')
-    app.run(host='0.0.0.0', port=12000)
+    run(bot)
@@ -1,287 +1,232 @@
 import json
-from common.poll import Poll
-from flask import Flask, request
-from dotenv import load_dotenv
+from common.poll import PollRegistry
 import os
-
-from common.utils import create_webhook
-from webexpythonsdk import WebexAPI, Webhook
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Get the bot access token from the environment variable
-WEBEX_TEAMS_ACCESS_TOKEN = os.getenv('WEBEX_TEAMS_ACCESS_TOKEN')
-
-if not WEBEX_TEAMS_ACCESS_TOKEN:
-    raise ValueError("WEBEX_TEAMS_ACCESS_TOKEN is not set correctly in the environment variables")
+import sys
+import time
+
+from common import cards
+from common.bot import METRICS, create_app, run, setup_common, webhook_route
+from common.lifecycle import IdleTracker, PollArchive
+from common.metrics import Metrics
+from common.router import CommandRouter
+from common.scheduler import Scheduler, parse_minutes
+from common.state import LocalPollState
+from common.store import PollStore
+
+# Polls and their deadlines, in a file of their own so task3 can run in the same host
+ANONYMOUS_POLL_DB_PATH = os.getenv('ANONYMOUS_POLL_DB_PATH', 'anonymous_polls.db')
+# Ended polls keep only their results, in this SQLite file
+POLL_ARCHIVE_PATH = os.getenv('POLL_ARCHIVE_PATH', ANONYMOUS_POLL_DB_PATH)
+# Close or discard polls nobody has used for this many seconds, 0 to keep them forever
+POLL_IDLE_TTL = int(os.getenv('POLL_IDLE_TTL', str(7 * 24 * 3600)))
+
+bot = sys.modules[__name__]   # common.bot sets the clients below on this module in setup()
 
 teams_api = None
-all_polls = {}
-
-commands = ['create poll', 'add option', 'start poll', 'end poll', 'help']
-
-app = Flask(__name__)
-@app.route('/messages_webhook', methods=['POST'])
-def messages_webhook():
-    if request.method == 'POST':
-        webhook_obj = Webhook(request.json)
-        return process_message(webhook_obj.data)
-
+identity = None
+workers = None
+dispatcher = None
+seen_events = None
+event_log = None
+archive = None
+all_polls = None
+
+metrics = Metrics(METRICS)
+router = CommandRouter(metrics=metrics)
+# Poll deadlines and scheduled reminders, persisted next to the polls
+scheduler = Scheduler()
+
+app = create_app(bot)
+
+@webhook_route(bot, '/messages_webhook')
+@metrics.timed('bot_handler_seconds', handler='process_message')
 def process_message(data):
-    if data.personId == teams_api.people.me().id:
+    if identity.is_me(data.personId):
         # Message sent by bot, do not respond
         return '200'
     else:
+        identity.remember(data.personId, data.personEmail)
         message = teams_api.messages.get(data.id).text
         print(message)
-        commands_split = (message.split())[1:]
-        command = ' '.join(commands_split)
-        parse_message(command, data.personEmail, data.roomId)
+        router.dispatch(message, data.roomId, data.personEmail)
         return '200'
 
-def parse_message(command, sender, roomId):
-    if command not in commands:
-        send_message_in_room(roomId, 'command not recognized type help for list of commands')
-    if command == 'help':
-        send_message_in_room(roomId, 'The valid commands are: create poll, add option, start poll, end poll')
-    if command == "create poll":
-        if roomId not in list(all_polls.keys()):
-            create_poll(roomId, sender)
-    elif command == "add option":
-        if all_polls[roomId]:
-            add_option(roomId, sender)
-    elif command == "start poll":
-        if all_polls[roomId]:
-            start_poll(roomId, sender)
-    elif command == "end poll":
-        if all_polls[roomId]:
-            end_poll(roomId, sender)
-    return
+@router.fallback
+def unknown_command(command, roomId, sender):
+    send_message_in_room(roomId, 'command not recognized type help for list of commands')
 
-def generate_start_poll_card(roomId):
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Please type your poll name below"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "poll_name",
-                    "placeholder": "Poll Name",
-                    "maxLength": 100
-                },
-                {
-                    "type": "TextBlock",
-                    "text": "Please type your poll description below"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "poll_description",
-                    "placeholder": "Poll Description",
-                    "maxLength": 500,
-                    "isMultiline": True
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
+@router.command('help')
+def show_help(roomId, sender):
+    send_message_in_room(roomId, 'The valid commands are: create poll, add option, start poll, end poll, results <poll name>')
 
-def generate_add_option_card(roomId):
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Please type the option you would like to add below:"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "option_text",
-                    "placeholder": "Option Text",
-                    "maxLength": 100
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
-
-def generate_voting_card(roomId):
-    poll = all_polls[roomId]
-    voting_options = {
-        "type": "Input.ChoiceSet",
-        "id": "poll_choice",
-        "style": "expanded",
-        "value": "1",
-        "choices": []
-    }
-    for value, option in poll.options.items():
-        voting_options["choices"].append({"title": option, "value": str(value)})
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Have your say on the poll below!",
-                    "size": "large"
-                },
-                {
-                    "type": "TextBlock",
-                    "text": all_polls[roomId].name,
-                    "size": "medium"
-                },
-                {
-                    "type": "TextBlock",
-                    "text": all_polls[roomId].description,
-                    "weight": "bolder"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                },
-                voting_options
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
-
-def generate_results_card(roomId, results):
-    card_results = {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Below are the results!",
-                    "size": "large"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": []
-        }
-    }
-    for option, total in results.items():
-        card_results["content"]["body"].append({
-            "type": "TextBlock",
-            "text": option + ": *" + str(total) + "*"
-        })
-    return card_results
+def poll_exists(roomId):
+    if roomId in all_polls:
+        return True
+    send_message_in_room(roomId, "Error: there is no poll in this room, type create poll to make one")
+    return False
 
+@router.command('create poll')
 def create_poll(roomId, sender):
-    teams_api.messages.create(toPersonEmail=sender, text="Cards Unsupported", attachments=[generate_start_poll_card(roomId)])
+    if roomId not in all_polls:
+        dispatcher.create_message(toPersonEmail=sender, text="Cards Unsupported", attachments=[cards.start_poll_card(roomId)])
 
+@router.command('add option')
 def add_option(roomId, sender):
-    teams_api.messages.create(toPersonEmail=sender, text="Cards Unsupported", attachments=[generate_add_option_card(roomId)])
+    if poll_exists(roomId):
+        dispatcher.create_message(toPersonEmail=sender, text="Cards Unsupported", attachments=[cards.add_option_card(roomId)])
 
+@router.command('start poll')
 def start_poll(roomId, sender):
+    if not poll_exists(roomId):
+        return
     if all_polls[roomId].author == sender:
         if not all_polls[roomId].started:
             all_polls[roomId].started = True
-            teams_api.messages.create(roomId=roomId, text="Cards Unsupported", attachments=[generate_voting_card(roomId)])
+            dispatcher.create_message(roomId=roomId, text="Cards Unsupported", attachments=[cards.voting_cards.get(all_polls[roomId])])
+            schedule_poll(all_polls[roomId])
+            idle_polls.touch(roomId)
         else:
             send_message_in_room(roomId, "Error: poll already started")
     else:
         send_message_in_room(roomId, "Error: only the poll author can start the poll")
 
+@router.command('end poll')
 def end_poll(roomId, sender):
+    if not poll_exists(roomId):
+        return
     if all_polls[roomId].author == sender:
         if all_polls[roomId].started:
-            all_polls[roomId].started = False
-            teams_api.messages.create(roomId=roomId, text="Card Unsupported", attachments=[generate_results_card(roomId, all_polls[roomId].collate_results())])
+            close_poll(roomId)
         else:
             send_message_in_room(roomId, "Error: poll hasn't been started yet")
     else:
         send_message_in_room(roomId, "Error: only the poll's author can end the poll")
 
-@app.route('/attachmentActions_webhook', methods=['POST'])
-def attachmentActions_webhook():
-    if request.method == 'POST':
-        print("attachmentActions POST!")
-        webhook_obj = Webhook(request.json)
-        return process_card_response(webhook_obj.data)
+def close_poll(roomId):
+    scheduler.cancel_room(roomId)
+    idle_polls.forget(roomId)
+    # Only the results outlive the poll, so the room is free for a new one
+    summary = all_polls.end_poll(roomId)
+    if archive is not None:
+        archive.add(summary)
+    dispatcher.create_message(roomId=roomId, text="Card Unsupported", attachments=[cards.results_card(roomId, dict(summary.results))])
+
+def schedule_poll(poll):
+    if not poll.duration:
+        return
+    deadline = time.time() + poll.duration * 60
+    poll.set_deadline(deadline)
+    scheduler.schedule(f'end:{poll.room_id}', deadline, 'end', poll.room_id)
+    for minutes in poll.reminders:
+        scheduler.schedule(f'remind:{poll.room_id}:{minutes}', deadline - minutes * 60, 'remind', poll.room_id)
+    send_message_in_room(poll.room_id, f"The poll closes automatically at {time.strftime('%H:%M', time.localtime(deadline))}.")
+
+@scheduler.on('end')
+def poll_deadline(roomId):
+    if roomId in all_polls and all_polls[roomId].started:
+        close_poll(roomId)
+
+@scheduler.on('remind')
+def scheduled_reminder(roomId):
+    # Votes are anonymous here, so remind the whole room rather than each non-voter
+    poll = all_polls.get(roomId)
+    if poll is not None and poll.started and poll.deadline:
+        minutes = max(1, round((poll.deadline - time.time()) / 60))
+        send_message_in_room(roomId, f"Reminder: the poll '{poll.name}' closes in {minutes} minutes. Cast your vote if you haven't yet!")
+
+def evict_idle_poll(roomId):
+    poll = all_polls.get(roomId)
+    if poll is None:
+        return
+    if poll.started and poll.deadline:
+        # Timed polls stay open until their deadline job closes them
+        return
+    if poll.started:
+        send_message_in_room(roomId, f"Closing the poll '{poll.name}' as nobody has used it for a while.")
+        close_poll(roomId)
+    else:
+        scheduler.cancel_room(roomId)
+        all_polls.pop(roomId, None)
+        send_message_in_room(roomId, f"Discarded the poll '{poll.name}' as it was never started.")
+
+idle_polls = IdleTracker(scheduler, POLL_IDLE_TTL, evict_idle_poll)
+
+@router.prefix('results')
+def show_archived_results(name, roomId, sender):
+    if not name:
+        recent = archive.recent(roomId)
+        if recent:
+            send_message_in_room(roomId, 'Ended polls in this room: ' + ', '.join(
+                f"{poll_name} ({time.strftime('%Y-%m-%d', time.localtime(ended))})" for poll_name, ended in recent))
+        else:
+            send_message_in_room(roomId, 'No poll has ended in this room yet.')
+        return
+    summary = archive.find(roomId, name)
+    if summary is None:
+        send_message_in_room(roomId, f"No ended poll called '{name}' in this room.")
+    else:
+        dispatcher.create_message(roomId=roomId, text="Card Unsupported", attachments=[cards.results_card(roomId, dict(summary.results))])
 
+@webhook_route(bot, '/attachmentActions_webhook')
+@metrics.timed('bot_handler_seconds', handler='process_card_response')
 def process_card_response(data):
     attachment = (teams_api.attachment_actions.get(data.id)).json_data
     inputs = attachment['inputs']
+    idle_polls.touch(inputs['roomId'])
     if 'poll_name' in list(inputs.keys()):
-        add_poll(inputs['poll_name'], inputs['poll_description'], inputs['roomId'], teams_api.people.get(data.personId).emails[0])
+        poll = add_poll(inputs['poll_name'], inputs['poll_description'], inputs['roomId'], identity.get_email(data.personId))
+        duration = float(inputs.get('poll_duration') or 0)
+        if duration > 0:
+            poll.set_timing(duration, parse_minutes(inputs.get('poll_reminders')))
         send_message_in_room(inputs['roomId'], "Poll created with title: " + inputs['poll_name'])
     elif 'option_text' in list(inputs.keys()):
-        current_poll = all_polls[inputs['roomId']]
+        current_poll = all_polls.get(inputs['roomId'])
+        if current_poll is None:
+            # A card left over from a poll that has since ended
+            return '200'
         current_poll.add_option(inputs['option_text'])
         send_message_in_room(inputs['roomId'], "Option added to poll \"" + current_poll.name + "\": " + inputs['option_text'])
         print(current_poll.name)
         print(current_poll.options)
     elif 'poll_choice' in list(inputs.keys()):
-        current_poll = all_polls[inputs['roomId']]
-        current_poll.votes[int(inputs["poll_choice"])] += 1
+        current_poll = all_polls.get(inputs['roomId'])
+        if current_poll is None or not current_poll.started:
+            # The voting card outlived its poll, or the poll was reset before starting again
+            return '200'
+        try:
+            current_poll.count_vote(int(inputs["poll_choice"]))
+        except KeyError:
+            # Not one of the poll's options, e.g. a forged card submission; nothing was recorded
+            pass
     return '200'
 
 def add_poll(poll_name, poll_description, room_id, author):
     print(author)
-    poll = Poll(poll_name, poll_description, room_id, author)
-    all_polls[room_id] = poll
+    return all_polls.new_poll(poll_name, poll_description, room_id, author)
 
 def send_direct_message(person_email, message):
-    teams_api.messages.create(toPersonEmail=person_email, text=message)
+    dispatcher.create_message(toPersonEmail=person_email, text=message)
 
 def send_message_in_room(room_id, message):
-    teams_api.messages.create(roomId=room_id, text=message)
-
+    dispatcher.create_message(roomId=room_id, text=message)
+
+
+WEBHOOKS = [
+    ('messages_webhook', '/messages_webhook', 'messages'),
+    ('attachmentActions_webhook', '/attachmentActions_webhook', 'attachmentActions'),
+]
+
+def setup(access_token=None, shared_workers=None, adapter=None, event_log=None, base_url=None):
+    global all_polls, archive
+    setup_common(bot, access_token, shared_workers, adapter, event_log=event_log, base_url=base_url)
+    store = PollStore(ANONYMOUS_POLL_DB_PATH)
+    all_polls = PollRegistry(LocalPollState(store))
+    scheduler.store = store
+    archive = PollArchive(POLL_ARCHIVE_PATH)
+    scheduler.start()
+    for room_id in all_polls:
+        idle_polls.touch(room_id)
+    return app
 
 if __name__ == '__main__':
-    teams_api = WebexAPI(access_token=WEBEX_TEAMS_ACCESS_TOKEN)
-    create_webhook(teams_api, 'messages_webhook', '/messages_webhook', 'messages')
-    create_webhook(teams_api, 'attachmentActions_webhook', '/attachmentActions_webhook', 'attachmentActions')
-    app.run(host='0.0.0.0', port=12000)
+    run(bot)
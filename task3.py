@@ -1,253 +1,148 @@
-from common.poll import Poll
-from flask import Flask, request
-from dotenv import load_dotenv
+from common.poll import PollRegistry
+import asyncio
 import os
-
-from common.utils import create_webhook
-from webexpythonsdk import WebexAPI, Webhook
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Get the bot access token from the environment variable
-WEBEX_TEAMS_ACCESS_TOKEN = os.getenv('WEBEX_TEAMS_ACCESS_TOKEN')
-
-if not WEBEX_TEAMS_ACCESS_TOKEN:
-    raise ValueError("WEBEX_TEAMS_ACCESS_TOKEN is not set correctly in the environment variables")
+import sys
+import threading
+import time
+
+from common import cards
+from common.bot import METRICS, PUBLIC_URL, WEBHOOK_WORKERS, create_app, setup_common, webhook_route
+from common.fanout import fan_out
+from common.lifecycle import IdleTracker, PollArchive
+from common.metrics import Metrics
+from common.live import LiveResults
+from common.roster import Roster
+from common.router import CommandRouter
+from common.scheduler import Scheduler, parse_minutes
+from common.state import LocalPollState, RespClient, RespPollState
+from common.store import PollStore
+from common.utils import reconcile_webhooks
+
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '8'))
+# Keep one results message per poll up to date instead of posting new ones
+LIVE_RESULTS = os.getenv('LIVE_RESULTS', '0') == '1'
+LIVE_RESULTS_DEBOUNCE = float(os.getenv('LIVE_RESULTS_DEBOUNCE', '2'))
+POLL_DB_PATH = os.getenv('POLL_DB_PATH', 'polls.db')
+# e.g. redis://127.0.0.1:6379/0 to share polls between workers and nodes. Each worker then gets only
+# some of the membership events, so rosters are listed afresh for reminders and polls no longer end
+# on their own once everyone has voted
+POLL_STATE_URL = os.getenv('POLL_STATE_URL')
+# Ended polls keep only their results, in this SQLite file
+POLL_ARCHIVE_PATH = os.getenv('POLL_ARCHIVE_PATH', POLL_DB_PATH)
+# Close or discard polls nobody has used for this many seconds, 0 to keep them forever
+POLL_IDLE_TTL = int(os.getenv('POLL_IDLE_TTL', str(7 * 24 * 3600)))
+# Serve webhooks from asyncio instead of Flask and the worker threads (needs aiohttp)
+ASYNC_SERVER = os.getenv('ASYNC_SERVER', '0') == '1'
+ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', '10000'))
+
+bot = sys.modules[__name__]   # common.bot sets the clients below on this module in setup()
 
 teams_api = None
-all_polls = {}
+identity = None
+workers = None
+dispatcher = None
+seen_events = None
+event_log = None
+live_results = None
+all_polls = None
+archive = None
+roster = None
+async_webex = None
 votes = set()
+reminding = set()   # rooms with reminders being sent right now
+reminding_lock = threading.Lock()
+
+metrics = Metrics(METRICS)
+router = CommandRouter(metrics=metrics)
+# Poll deadlines and scheduled reminders, persisted next to the polls when they are local
+scheduler = Scheduler()
 
-commands = ['create poll', 'add option', 'start poll', 'end poll', 'help', 'show poll', 'remind to vote']
+app = create_app(bot)
 
-app = Flask(__name__)
-@app.route('/messages_webhook', methods=['POST'])
-def messages_webhook():
-    if request.method == 'POST':
-        webhook_obj = Webhook(request.json)
-        return process_message(webhook_obj.data)
+def room_of(data):
+    return data.roomId
 
+# Events for one room run in order, rooms run in parallel
+@webhook_route(bot, '/messages_webhook', room_of)
+@metrics.timed('bot_handler_seconds', handler='process_message')
 def process_message(data):
-    if data.personId == teams_api.people.me().id:
+    if identity.is_me(data.personId):
         # Message sent by bot, do not respond
         return '200'
     else:
+        identity.remember(data.personId, data.personEmail)
         message = teams_api.messages.get(data.id).text
         print(message)
-        commands_split = (message.split())[1:]
-        command = ' '.join(commands_split)
-        parse_message(command, data.personEmail, data.roomId)
+        router.dispatch(message, data.roomId, data.personEmail)
         return '200'
 
-def remind_users_to_vote(roomId):
+async def process_message_async(data):
+    if identity.is_me(data.personId):
+        return
+    identity.remember(data.personId, data.personEmail)
+    message = (await async_webex.get_message(data.id))['text']
+    print(message)
+    # Commands use the blocking state and dispatcher calls, so keep them off the event loop
+    await asyncio.to_thread(router.dispatch, message, data.roomId, data.personEmail)
+
+@router.command('remind to vote', 'ping poll')
+def remind_users_to_vote(roomId, sender):
     if roomId not in all_polls:
         send_message_in_room(roomId, "No active poll in this room.")
         return
 
-    poll = all_polls[roomId]
-
-    # Fetch the list of all participants in the room
-    participants = teams_api.memberships.list(roomId=roomId)
-
-    # Get the email addresses of those who have already voted
-    users_who_voted = poll.votes.keys()
-
-    # Send reminders to users who have not voted
-    for participant in participants: # loops through the participants
-        user_email = participant.personEmail # sets participants email
-        if user_email not in users_who_voted: # checks if user has voted
-            send_direct_message(user_email, f"Reminder: You have not voted in the poll '{poll.name}' yet! Please cast your vote.")
-
-    send_message_in_room(roomId, "Reminder sent to users who have not voted.")
-
-def parse_message(command, sender, roomId):
-    if command not in commands:
-        send_message_in_room(roomId, 'Command not recognized. Type help for a list of commands.')
-    if command == 'help':
-        send_message_in_room(roomId, 'The valid commands are: create poll, add option, start poll, end poll, remind to vote')
-    if command == "create poll":
-        if roomId in list(all_polls.keys()):
-            if all_polls[roomId].started:   # checks to see if a poll is active
-                send_message_in_room(roomId, "Error: A poll has already started in this room. Please end the current poll before creating a new one.")
-            else:
-                create_poll(roomId, sender)
-        else:
-            create_poll(roomId, sender)
-    elif command == "add option":
-        if all_polls[roomId]:
-            add_option(roomId, sender)
-    elif command == "start poll":
-        if all_polls[roomId]:
-            start_poll(roomId, sender)
-    elif command == "end poll":
-        if all_polls[roomId]:
-            end_poll(roomId, sender)
-    elif command == 'remind to vote':
-        remind_users_to_vote(roomId)
-    elif command == 'show poll':
-        show_poll(roomId, sender)
-    return
-
-def generate_start_poll_card(roomId):
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Please type your poll name below"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "poll_name",
-                    "placeholder": "Poll Name",
-                    "maxLength": 100
-                },
-                {
-                    "type": "TextBlock",
-                    "text": "Please type your poll description below"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "poll_description",
-                    "placeholder": "Poll Description",
-                    "maxLength": 500,
-                    "isMultiline": True
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
-
-def generate_add_option_card(roomId):
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Please type the option you would like to add below:"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "option_text",
-                    "placeholder": "Option Text",
-                    "maxLength": 100
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
-
-def generate_voting_card(roomId):
-    poll = all_polls[roomId]
-    voting_options = {
-        "type": "Input.ChoiceSet",
-        "id": "poll_choice",
-        "style": "expanded",
-        "value": "1",
-        "choices": []
-    }
-    for value, option in poll.options.items():
-        voting_options["choices"].append({"title": option, "value": str(value)})
-    return {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Have your say on the poll below!",
-                    "size": "large"
-                },
-                {
-                    "type": "TextBlock",
-                    "text": all_polls[roomId].name,
-                    "size": "medium"
-                },
-                {
-                    "type": "TextBlock",
-                    "text": all_polls[roomId].description,
-                    "weight": "bolder"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                },
-                voting_options
-            ],
-            "actions": [
-                {
-                    "type": "Action.Submit",
-                    "title": "OK"
-                }
-            ]
-        }
-    }
-
-def generate_results_card(roomId, results):
-    card_results = {
-        "contentType": "application/vnd.microsoft.card.adaptive",
-        "content": {
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "type": "AdaptiveCard",
-            "version": "1.1",
-            "body": [
-                {
-                    "type": "TextBlock",
-                    "text": "Below are the results!",
-                    "size": "large"
-                },
-                {
-                    "type": "Input.Text",
-                    "id": "roomId",
-                    "value": roomId,
-                    "isVisible": False
-                }
-            ],
-            "actions": []
-        }
-    }
-    for option, total in results.items():
-        card_results["content"]["body"].append({
-            "type": "TextBlock",
-            "text": option + ": *" + str(total) + "*"
-        })
-    return card_results
-
+    if not start_reminders(roomId, all_polls[roomId], "Sending reminders to users who have not voted..."):
+        send_message_in_room(roomId, "Reminders are already being sent for this poll.")
+
+def start_reminders(roomId, poll, announcement=None):
+    # One run per room, so a second command or a scheduled reminder can't message everyone twice
+    with reminding_lock:
+        if roomId in reminding:
+            return False
+        reminding.add(roomId)
+    if announcement:
+        send_message_in_room(roomId, announcement)
+    # Send the reminders in the background so the worker is free for other events
+    threading.Thread(target=send_vote_reminders, args=(roomId, poll), daemon=True).start()
+    return True
+
+def send_vote_reminders(roomId, poll):
+    try:
+        remind_non_voters(roomId, poll)
+    finally:
+        with reminding_lock:
+            reminding.discard(roomId)
+
+def remind_non_voters(roomId, poll):
+    reminder = f"Reminder: You have not voted in the poll '{poll.name}' yet! Please cast your vote."
+
+    def remind(email):
+        if poll.has_voted(email):
+            return False
+        dispatcher.create_message(wait=True, toPersonEmail=email, text=reminder)
+        return True
+
+    def report_progress(counts):
+        send_message_in_room(roomId, f"Reminders in progress: {counts['sent']} sent, {counts['failed']} failed, {counts['skipped']} skipped so far.")
+
+    counts = fan_out(roster.members(roomId), remind, REMINDER_CONCURRENCY, report_progress)
+    send_message_in_room(roomId, f"Reminders finished: {counts['sent']} sent, {counts['failed']} failed, {counts['skipped']} skipped.")
+
+@router.fallback
+def unknown_command(command, roomId, sender):
+    send_message_in_room(roomId, 'Command not recognized. Type help for a list of commands.')
+
+@router.command('help')
+def show_help(roomId, sender):
+    send_message_in_room(roomId, 'The valid commands are: create poll, add option, start poll, end poll, show poll, remind to vote (or ping poll), results <poll name>')
+
+def poll_exists(roomId):
+    if roomId in all_polls:
+        return True
+    send_message_in_room(roomId, "Error: there is no poll in this room. Type create poll to make one.")
+    return False
+
+@router.command('show poll')
 def show_poll(room_id, sender):
     if room_id in all_polls:
         poll_data = all_polls[room_id]
@@ -255,59 +150,185 @@ def show_poll(room_id, sender):
         results_message = f'Poll: {poll_data.name}\nDescription: {poll_data.description}\n\n'
         
         # Add options and vote counts
-        for option, count in poll_data.votes.items():
-            results_message += f'{poll_data.options[option]}: {count} votes\n'
+        votes = poll_data.votes
+        for num, option in poll_data.options.items():
+            results_message += f'{option}: {votes.get(num, 0)} votes\n'
             
-        send_message_in_room(room_id, results_message)
+        if live_results and poll_data.live_message_id:
+            # The space already has a live results message, so answer privately
+            send_direct_message(sender, results_message)
+        else:
+            send_message_in_room(room_id, results_message)
     else:
         send_message_in_room(room_id, 'Poll not found or has not been created yet.')
 
 
+@router.command('create poll')
 def create_poll(roomId, sender):
-    if roomId not in all_polls or (roomId in all_polls and not all_polls[roomId].started):
-        teams_api.messages.create(toPersonEmail=sender, text="Cards Unsupported", attachments=[generate_start_poll_card(roomId)])
+    if roomId not in all_polls or not all_polls[roomId].started:
+        dispatcher.create_message(toPersonEmail=sender, text="Cards Unsupported", attachments=[cards.start_poll_card(roomId)])
     else:
         send_message_in_room(roomId, 'Poll already exists in this room. Please wait until the current poll ends.')
 
+@router.command('add option')
 def add_option(roomId, sender):
-    if all_polls[roomId]:
-        teams_api.messages.create(toPersonEmail=sender, text="Cards Unsupported", attachments=[generate_add_option_card(roomId)])
+    if poll_exists(roomId):
+        dispatcher.create_message(toPersonEmail=sender, text="Cards Unsupported", attachments=[cards.add_option_card(roomId)])
 
+@router.command('start poll')
 def start_poll(roomId, sender):
+    if not poll_exists(roomId):
+        return
     if all_polls[roomId].author == sender: 
         if not all_polls[roomId].started: # checks for inactive polls to start 
             all_polls[roomId].started = True # sets the value to true 
-            teams_api.messages.create(roomId=roomId, text="Cards Unsupported", attachments=[generate_voting_card(roomId)])
+            dispatcher.create_message(roomId=roomId, text="Cards Unsupported", attachments=[cards.voting_cards.get(all_polls[roomId])])
+            schedule_poll(all_polls[roomId])
+            idle_polls.touch(roomId)
+            if roster is not None and roster.cache:
+                roster.count(roomId)   # list the members now rather than on the first vote
+            if live_results:
+                poll = all_polls[roomId]
+                message = dispatcher.create_message(wait=True, roomId=roomId, markdown=live_results_markdown(poll))
+                poll.set_live_message(message.id)
             
         else:
             send_message_in_room(roomId, "Error: poll already started")
     else:
         send_message_in_room(roomId, "Error: only the poll author can start the poll")
 
+@router.command('end poll')
 def end_poll(roomId, sender):
+    if not poll_exists(roomId):
+        return
     if all_polls[roomId].author == sender:
         if all_polls[roomId].started:   # checking for active poll to end
-            all_polls[roomId].started = False   # ending the poll
-            teams_api.messages.create(roomId=roomId, text="Card Unsupported", attachments=[generate_results_card(roomId, all_polls[roomId].collate_results())])
-            del all_polls[roomId] # delete poll from dictionary
+            close_poll(roomId)
         else:
             send_message_in_room(roomId, "Error: poll hasn't been started yet")
     else:
         send_message_in_room(roomId, "Error: only the poll's author can end the poll")
 
-@app.route('/attachmentActions_webhook', methods=['POST'])
-def attachmentActions_webhook():
-    if request.method == 'POST':
-        print("attachmentActions POST!")
-        webhook_obj = Webhook(request.json)
-        return process_card_response(webhook_obj.data)
+def close_poll(roomId):
+    scheduler.cancel_room(roomId)
+    idle_polls.forget(roomId)
+    all_polls[roomId].started = False   # ending the poll
+    if live_results:
+        live_results.flush(roomId)
+    summary = all_polls.end_poll(roomId) # freeze the results and drop the poll's state
+    if archive is not None:
+        archive.add(summary)
+    dispatcher.create_message(roomId=roomId, text="Card Unsupported", attachments=[cards.results_card(roomId, dict(summary.results))])
+
+def schedule_poll(poll):
+    if not poll.duration:
+        return
+    deadline = time.time() + poll.duration * 60
+    poll.set_deadline(deadline)
+    scheduler.schedule(f'end:{poll.room_id}', deadline, 'end', poll.room_id)
+    for minutes in poll.reminders:
+        scheduler.schedule(f'remind:{poll.room_id}:{minutes}', deadline - minutes * 60, 'remind', poll.room_id)
+    send_message_in_room(poll.room_id, f"The poll closes automatically at {time.strftime('%H:%M', time.localtime(deadline))}.")
+
+def in_room_order(roomId, fn):
+    # Run timed work behind the room's queued events, or right here if the queue is full
+    if workers is None or not workers.submit(fn, roomId, key=roomId):
+        fn(roomId)
+
+@scheduler.on('end')
+def poll_deadline(roomId):
+    in_room_order(roomId, end_poll_at_deadline)
+
+def end_poll_at_deadline(roomId):
+    if roomId in all_polls and all_polls[roomId].started:
+        close_poll(roomId)
+
+@scheduler.on('remind')
+def scheduled_reminder(roomId):
+    if roomId in all_polls and all_polls[roomId].started:
+        start_reminders(roomId, all_polls[roomId])
+
+def evict_idle_poll(roomId):
+    if roomId not in all_polls:
+        return
+    poll = all_polls[roomId]
+    if poll.started and poll.deadline:
+        # Timed polls stay open until their deadline job closes them
+        return
+    if poll.started:
+        send_message_in_room(roomId, f"Closing the poll '{poll.name}' as nobody has used it for a while.")
+        close_poll(roomId)
+    else:
+        scheduler.cancel_room(roomId)
+        del all_polls[roomId]
+        send_message_in_room(roomId, f"Discarded the poll '{poll.name}' as it was never started.")
+
+idle_polls = IdleTracker(scheduler, POLL_IDLE_TTL, lambda roomId: in_room_order(roomId, evict_idle_poll))
+
+@router.prefix('results')
+def show_archived_results(name, roomId, sender):
+    if not name:
+        recent = archive.recent(roomId)
+        if recent:
+            send_message_in_room(roomId, 'Ended polls in this room: ' + ', '.join(
+                f"{poll_name} ({time.strftime('%Y-%m-%d', time.localtime(ended))})" for poll_name, ended in recent))
+        else:
+            send_message_in_room(roomId, 'No poll has ended in this room yet.')
+        return
+    summary = archive.find(roomId, name)
+    if summary is None:
+        send_message_in_room(roomId, f"No ended poll called '{name}' in this room.")
+    else:
+        dispatcher.create_message(roomId=roomId, text="Card Unsupported", attachments=[cards.results_card(roomId, dict(summary.results))])
+
+def check_all_voted(roomId):
+    # An uncached roster means a shared deployment, where listing the room after every vote costs too much
+    if roster is None or not roster.cache or roomId not in all_polls:
+        return
+    poll = all_polls[roomId]
+    # Comparing counts is enough to rule out almost every vote; members are only checked one by one once it passes
+    if not poll.started or poll.voter_count < roster.count(roomId):
+        return
+    if all(poll.has_voted(email) for email in roster.members(roomId)):
+        send_message_in_room(roomId, "Everyone has voted, closing the poll.")
+        close_poll(roomId)
 
+def live_results_markdown(poll):
+    results = poll.collate_results()
+    lines = [f"**Live results: {poll.name}** ({sum(results.values())} votes)"]
+    for option, total in results.items():
+        lines.append(f"- {option}: **{total}**")
+    return '\n'.join(lines)
+
+def lookup_live_results(roomId):
+    try:
+        poll = all_polls[roomId]
+    except KeyError:
+        return None
+    return poll.live_message_id, live_results_markdown(poll)
+
+# Votes come from the card in the poll's room, so they queue behind that room's commands
+@webhook_route(bot, '/attachmentActions_webhook', room_of)
+@metrics.timed('bot_handler_seconds', handler='process_card_response')
 def process_card_response(data):
     attachment = (teams_api.attachment_actions.get(data.id)).json_data
-    user_email = teams_api.people.get(data.personId).emails[0]
-    inputs = attachment['inputs']
+    user_email = identity.get_email(data.personId)
+    handle_card_inputs(attachment['inputs'], user_email)
+    return '200'
+
+async def process_card_response_async(data):
+    # The card inputs and the submitter's email are independent lookups
+    attachment, user_email = await asyncio.gather(async_webex.get_attachment_action(data.id),
+                                                  async_webex.get_email(identity, data.personId))
+    await asyncio.to_thread(handle_card_inputs, attachment['inputs'], user_email)
+
+def handle_card_inputs(inputs, user_email):
+    idle_polls.touch(inputs['roomId'])
     if 'poll_name' in list(inputs.keys()):
-        add_poll(inputs['poll_name'], inputs['poll_description'], inputs['roomId'], teams_api.people.get(data.personId).emails[0])
+        poll = add_poll(inputs['poll_name'], inputs['poll_description'], inputs['roomId'], user_email)
+        duration = float(inputs.get('poll_duration') or 0)
+        if duration > 0:
+            poll.set_timing(duration, parse_minutes(inputs.get('poll_reminders')))
         send_message_in_room(inputs['roomId'], "Poll created with title: " + inputs['poll_name'])
     elif 'option_text' in list(inputs.keys()):
         current_poll = all_polls[inputs['roomId']]
@@ -318,28 +339,94 @@ def process_card_response(data):
     elif 'poll_choice' in list(inputs.keys()):
         current_poll = all_polls[inputs['roomId']]
         choice = int(inputs["poll_choice"]) 
-        vote_success = current_poll.vote(choice, user_email)  # vote will be a success if user email not in the set in the poll class to track voters       
+        try:
+            vote_success = current_poll.vote(choice, user_email)  # vote will be a success if user email not in the set in the poll class to track voters       
+        except KeyError:
+            # Not one of the poll's options, e.g. a forged card submission; nothing was recorded
+            send_direct_message(user_email, 'That option is not part of this poll')
+            return
         if vote_success:
+            if live_results:
+                live_results.touch(current_poll.room_id)
             send_direct_message(user_email, f'You voted for {current_poll.options[choice]} in {current_poll.name}') # formatted string to show what you voted for and in what poll
+            check_all_voted(current_poll.room_id)
         else:
             send_direct_message(user_email, 'You have already voted in this poll')
 
-    return '200'
+@webhook_route(bot, '/memberships_webhook/created', room_of)
+def member_joined(data):
+    roster.joined(data.roomId, data.personId, data.personEmail)
+
+@webhook_route(bot, '/memberships_webhook/deleted', room_of)
+def member_left(data):
+    roster.left(data.roomId, data.personId, data.personEmail)
+    # The last member who hadn't voted may be the one leaving
+    check_all_voted(data.roomId)
+
+async def member_joined_async(data):
+    # May wait on the room's lock while the roster lists the room
+    await asyncio.to_thread(member_joined, data)
+
+async def member_left_async(data):
+    await asyncio.to_thread(member_left, data)
 
 def add_poll(poll_name, poll_description, room_id, author):
     print(author)
-    poll = Poll(poll_name, poll_description, room_id, author)
-    all_polls[room_id] = poll
+    return all_polls.new_poll(poll_name, poll_description, room_id, author)
 
 def send_direct_message(person_email, message):
-    teams_api.messages.create(toPersonEmail=person_email, text=message)
+    dispatcher.create_message(toPersonEmail=person_email, text=message)
 
 def send_message_in_room(room_id, message):
-    teams_api.messages.create(roomId=room_id, text=message)
-
-
+    dispatcher.create_message(roomId=room_id, text=message)
+
+WEBHOOKS = [
+    ('messages_webhook', '/messages_webhook', 'messages'),
+    ('attachmentActions_webhook', '/attachmentActions_webhook', 'attachmentActions'),
+    # Keep the room rosters current for the "everyone has voted" check
+    ('memberships_created_webhook', '/memberships_webhook/created', 'memberships', 'created'),
+    ('memberships_deleted_webhook', '/memberships_webhook/deleted', 'memberships', 'deleted'),
+]
+
+def setup(access_token=None, shared_workers=None, adapter=None, event_log=None, base_url=None):
+    global live_results, all_polls, archive, roster
+    # Workers sharing POLL_STATE_URL also share which events they have seen
+    client = RespClient.from_url(POLL_STATE_URL) if POLL_STATE_URL else None
+    setup_common(bot, access_token, shared_workers, adapter, dedupe_client=client, event_log=event_log, base_url=base_url)
+    if LIVE_RESULTS:
+        live_results = LiveResults(dispatcher, lookup_live_results, LIVE_RESULTS_DEBOUNCE)
+    if POLL_STATE_URL:
+        all_polls = PollRegistry(RespPollState(client))
+        # Each worker only sees its share of the events, so none of them can tell a poll is idle
+        idle_polls.ttl = 0
+    else:
+        store = PollStore(POLL_DB_PATH)
+        all_polls = PollRegistry(LocalPollState(store))
+        scheduler.store = store
+    archive = PollArchive(POLL_ARCHIVE_PATH)
+    roster = Roster(teams_api, identity.me_id, cache=not POLL_STATE_URL)
+    scheduler.start()
+    for room_id in all_polls:
+        idle_polls.touch(room_id)
+    return app
+
+def async_server():
+    global async_webex
+    from common.aio import AsyncWebex, AsyncWebhookServer
+    async_webex = AsyncWebex(teams_api.access_token, metrics=metrics)
+    return AsyncWebhookServer({
+        '/messages_webhook': process_message_async,
+        '/attachmentActions_webhook': process_card_response_async,
+        '/memberships_webhook/created': member_joined_async,
+        '/memberships_webhook/deleted': member_left_async,
+    }, seen_events, async_webex, ASYNC_MAX_IN_FLIGHT, WEBHOOK_WORKERS, event_log, metrics)
+
+# Run several workers with e.g. `gunicorn -w 4 -b 0.0.0.0:12000 'task3:setup()'`
+# together with POLL_STATE_URL so they all share the same polls.
 if __name__ == '__main__':
-    teams_api = WebexAPI(access_token=WEBEX_TEAMS_ACCESS_TOKEN)
-    create_webhook(teams_api, 'messages_webhook', '/messages_webhook', 'messages')
-    create_webhook(teams_api, 'attachmentActions_webhook', '/attachmentActions_webhook', 'attachmentActions')
-    app.run(host='0.0.0.0', port=1200)
\ No newline at end of file
+    setup()
+    reconcile_webhooks(teams_api, WEBHOOKS, PUBLIC_URL)
+    if ASYNC_SERVER:
+        async_server().run(port=12000)
+    else:
+        app.run(host='0.0.0.0', port=12000)
\ No newline at end of file
@@ -1,98 +1,182 @@
 from ctypes import util
-from flask import Flask, request 
-from dotenv import load_dotenv   
+import csv
 import os
+import shutil
+import sys
+import tempfile
 from datetime import datetime
+from itertools import islice
 
-from common.utils import create_webhook 
-from webexpythonsdk import WebexAPI, Webhook
+from common.bot import METRICS, create_app, run, setup_common, webhook_route
+from common.metrics import Metrics
+from common.router import CommandRouter
+from common.search import NoteIndex
+from common.store import NoteStore
 
-# Load environment variables from .env file for configuration
-load_dotenv()
+NOTES_PAGE_SIZE = int(os.getenv('NOTES_PAGE_SIZE', '20'))
+NOTES_DB_PATH = os.getenv('NOTES_DB_PATH', 'notes.db')
+# Users whose note counts and search indexes are kept in memory
+NOTES_CACHE_USERS = int(os.getenv('NOTES_CACHE_USERS', '1024'))
+TIME_FORMAT = '%Y-%m-%d %H:%M'
 
-# Get the Webex Teams bot token from environment variables
-WEBEX_TEAMS_ACCESS_TOKEN = os.getenv('WEBEX_TEAMS_ACCESS_TOKEN')
-
-# Validate the access token exists
-if not WEBEX_TEAMS_ACCESS_TOKEN:
-    raise ValueError("WEBEX_TEAMS_ACCESS_TOKEN is not set correctly in the environment variables")
+bot = sys.modules[__name__]   # common.bot sets the clients below on this module in setup()
 
 teams_api = None 
-notes = {}   # Dictionary to store user notes in memory
+identity = None
+workers = None
+dispatcher = None
+seen_events = None
+event_log = None
+notes = None   # NoteStore holding every user's notes on disk
+metrics = Metrics(METRICS)
+router = CommandRouter(metrics=metrics)
 
 # Initialize Flask web application
-app = Flask(__name__)
-
-# Define webhook endpoint to receive messages from Webex
-@app.route('/messages_webhook', methods=['POST'])
-def messages_webhook():
-    if request.method == 'POST':
-        webhook_obj = Webhook(request.json)  
-        return process_message(webhook_obj.data)
+app = create_app(bot)
 
-# Main message processing function
+# Main message processing function, run on the worker pool for each message webhook
+@webhook_route(bot, '/messages_webhook')
+@metrics.timed('bot_handler_seconds', handler='process_message')
 def process_message(data):
     # Ignore messages sent by the bot itself
-    if data.personId == teams_api.people.me().id:
+    if identity.is_me(data.personId):
         return '200'
     else:
-        # Get the message text from Webex
+        # Get the message text from Webex and hand it to the matching command
         message = teams_api.messages.get(data.id).text.strip()
-        
-        # Add a new note
-        if message.lower().startswith('/add'):
-            note = message[4:].strip()  # Remove command prefix and whitespace
-            # Initialize user's notes list if it doesn't exist
-            if data.personEmail not in notes:
-                notes[data.personEmail] = []
-            # Add new note with timestamp
-            notes[data.personEmail].append({
-                'timestamp': datetime.now(),
-                'content': note
-            })
-            send_direct_message(data.personEmail, f"Note saved successfully!")
-        
-        # Show all notes    
-        elif message.lower() == '/show':
-            if data.personEmail not in notes or not notes[data.personEmail]:
-                send_direct_message(data.personEmail, "You don't have any saved notes.")
-            else:
-                # Format and display all notes with timestamps
-                response = "Your saved notes:\n\n"
-                for i, note in enumerate(notes[data.personEmail], 1):
-                    response += f"{i}. [{note['timestamp'].strftime('%Y-%m-%d %H:%M')}] {note['content']}\n"
-                send_direct_message(data.personEmail, response)
-        
-        # Clear all notes        
-        elif message.lower() == '/clear':
-            if data.personEmail in notes:
-                notes[data.personEmail] = []
-            send_direct_message(data.personEmail, "All notes cleared!")
-        
-        # Show help menu    
-        elif message.lower() == '/help':
-            help_text = """
+        router.dispatch(message, data)
+        return '200'
+
+# Add a new note
+@router.prefix('/add')
+def add_note(note, data):
+    # Add new note with timestamp
+    num = notes.add(data.personEmail, note)
+    note_index.add(data.personEmail, num, note)
+    send_direct_message(data.personEmail, f"Note saved successfully!")
+
+def format_note(note):
+    num, created, content = note
+    return f"{num}. [{datetime.fromtimestamp(created).strftime(TIME_FORMAT)}] {content}"
+
+def indexed_notes(user):
+    # What the search index is rebuilt from when a user isn't cached
+    return ((num, content) for num, created, content in notes.iter_notes(user))
+
+note_index = NoteIndex(NOTES_CACHE_USERS, indexed_notes)   # Search terms -> numbers of each user's notes
+
+# Show notes a page at a time, newest first
+@router.prefix('/show')
+def show_notes(page, data):
+    count = notes.count(data.personEmail)
+    if not count:
+        send_direct_message(data.personEmail, "You don't have any saved notes.")
+        return
+    try:
+        page = int(page or 1)
+    except ValueError:
+        send_direct_message(data.personEmail, "Usage: /show [page number]")
+        return
+    pages = -(-count // NOTES_PAGE_SIZE)
+    if not 1 <= page <= pages:
+        send_direct_message(data.personEmail, f"There {'is' if pages == 1 else 'are'} only {pages} page{'s' * (pages != 1)} of notes.")
+        return
+    # Only the notes on this page are read, however many the user has
+    lines = [f"Your saved notes, page {page} of {pages}:\n"]
+    for note in notes.newest(data.personEmail, (page - 1) * NOTES_PAGE_SIZE, NOTES_PAGE_SIZE):
+        lines.append(format_note(note))
+    if page < pages:
+        lines.append(f"\nType /show {page + 1} for older notes.")
+    send_direct_message(data.personEmail, '\n'.join(lines))
+
+# Send all notes as a file
+@router.prefix('/export')
+def export_notes(fmt, data):
+    fmt = {'': 'csv', 'markdown': 'md'}.get(fmt.lower(), fmt.lower())
+    if fmt not in ('csv', 'md'):
+        send_direct_message(data.personEmail, "Usage: /export [csv|md]")
+        return
+    count = notes.count(data.personEmail)
+    if not count:
+        send_direct_message(data.personEmail, "You don't have any saved notes.")
+        return
+    directory = tempfile.mkdtemp(prefix='notes-export-')
+    path = os.path.join(directory, f"notes-{datetime.now().strftime('%Y%m%d')}.{fmt}")
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            write_notes(f, islice(notes.iter_notes(data.personEmail), count), fmt)
+        # The SDK streams the file from disk in the upload
+        dispatcher.create_message(wait=True, toPersonEmail=data.personEmail, text=f"Here are your {count} notes.", files=[path])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def write_notes(f, user_notes, fmt):
+    # One note at a time, the export is never built up in memory
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(['number', 'timestamp', 'note'])
+        for num, created, content in user_notes:
+            writer.writerow([num, datetime.fromtimestamp(created).strftime(TIME_FORMAT), content])
+    else:
+        f.write('# Notes\n\n')
+        for note in user_notes:
+            f.write(format_note(note).replace('\n', '\n   ') + '\n')
+
+# Clear all notes
+@router.command('/clear')
+def clear_notes(data):
+    notes.clear(data.personEmail)
+    note_index.clear(data.personEmail)
+    send_direct_message(data.personEmail, "All notes cleared!")
+
+# Search notes
+@router.prefix('/search')
+def search_notes(query, data):
+    if not query:
+        send_direct_message(data.personEmail, "Usage: /search <words to look for>")
+        return
+    matches = notes.get(data.personEmail, note_index.search(data.personEmail, query))
+    if not matches:
+        send_direct_message(data.personEmail, f"No notes match '{query}'.")
+        return
+    # Numbered as in /show
+    lines = [f"Notes matching '{query}':\n"]
+    for note in matches:
+        lines.append(format_note(note))
+    send_direct_message(data.personEmail, '\n'.join(lines))
+
+# Show help menu
+@router.command('/help')
+def show_help(data):
+    help_text = """
 Available commands:
 - /add <your note> - Save a new note
-- /show - Display all your saved notes
+- /show [page] - Display your saved notes, newest first
+- /export [csv|md] - Get all your notes as a file
+- /search <words> - Find the notes that best match the words
 - /clear - Delete all your notes
 - /help - Show this help message
 """
-            send_direct_message(data.personEmail, help_text)
-        
-        # Handle unknown commands    
-        else:
-            send_direct_message(data.personEmail, "I didn't understand that command. Type '/help' to see available commands.")
-            
-        return '200'
+    send_direct_message(data.personEmail, help_text)
+
+# Handle unknown commands
+@router.fallback
+def unknown_command(message, data):
+    send_direct_message(data.personEmail, "I didn't understand that command. Type '/help' to see available commands.")
 
 def send_direct_message(person_email, message):
-    teams_api.messages.create(toPersonEmail=person_email, text=message)
+    dispatcher.create_message(toPersonEmail=person_email, text=message)
 
 def send_message_in_room(room_id, message):
-    teams_api.messages.create(roomId=room_id, text=message)
+    dispatcher.create_message(roomId=room_id, text=message)
+
+WEBHOOKS = [('messages_webhook', '/messages_webhook', 'messages')]
+
+def setup(access_token=None, shared_workers=None, adapter=None, event_log=None, base_url=None):
+    global notes
+    setup_common(bot, access_token, shared_workers, adapter, event_log=event_log, base_url=base_url)
+    notes = NoteStore(NOTES_DB_PATH, NOTES_CACHE_USERS)
+    return app
 
 if __name__ == '__main__':
-    teams_api = WebexAPI(access_token=WEBEX_TEAMS_ACCESS_TOKEN)
-    create_webhook(teams_api, 'messages_webhook', '/messages_webhook', 'messages')
-    app.run(host='0.0.0.0', port=12000)
+    run(bot)